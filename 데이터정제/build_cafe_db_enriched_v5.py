@@ -10,11 +10,20 @@ build_cafe_db_enriched_v5.py
 원본: build_cafe_db_enriched.py 기반(사용자 제공 파일) 
 """
 
-import re, json, hashlib, argparse
+import os, re, sys, gzip, json, math, time, heapq, shutil, hashlib, argparse, tempfile, itertools
+import numpy as np
 import pandas as pd
 import csv
-from collections import Counter, defaultdict
-from kiwipiepy import Kiwi
+import sqlite3
+from array import array
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from kiwipiepy import Kiwi, Match, __version__ as KIWI_VERSION
+try:
+    import brotli  # 선택: 설치되어 있으면 정적 문서(--out_docs_dir)에 .br 변형도 생성
+except ImportError:
+    brotli = None
 
 MYSQL_NULL = r"\N"  # LOAD DATA INFILE에서 NULL로 인식하는 표준 표기
 
@@ -37,6 +46,22 @@ DEFAULT_OUT_GLOBAL = "global_token_freq_v2.csv"
 DEFAULT_OUT_PRICE_ITEMS   = "cafe_price_items_v1.csv"      # 카페별 가격 항목(가능하면 메뉴 추정 포함)
 DEFAULT_OUT_PRICE_SUMMARY = "cafe_price_summary_v1.csv"    # 카페별 가격 요약(최소/최대/중앙값/목록)
 
+# (추가) 원본 행 -> 정규 cafe_id 매핑표(지역 간 중복 카페 식별 결과)
+DEFAULT_OUT_IDENTITY = "cafe_identity_map_v1.csv"
+
+# (추가) 월별 추이(--trend_dir 지정 시): 카페별 최근 키워드 / 메뉴 급상승
+DEFAULT_OUT_RECENT_KEYWORDS = "cafe_recent_keywords_v1.csv"
+DEFAULT_OUT_MENU_TREND      = "menu_trend_v1.csv"
+
+# (추가) 재채점(--rescore)용 카페 토큰 프로필(JSONL)
+DEFAULT_OUT_PROFILE = "cafe_token_profile_v1.jsonl"
+
+# (추가) 문장 단위 추출 결과(주차/가격/메뉴/편의시설 + 출처 문장)
+DEFAULT_OUT_FACTS = "cafe_facts_v1.csv"
+
+# (추가) Kiwi 전 블로그 글 거르기 결과(카페별 건수)
+DEFAULT_OUT_POST_FILTER = "cafe_post_filter_v1.csv"
+
 # =========================
 # (추가) MySQL 적재용 컬럼명 매핑
 # =========================
@@ -68,8 +93,7 @@ KOR_TO_SQL_COL = {
 # =========================
 # 2) 이모지 제거 + 텍스트 정리/정규화
 # =========================
-_EMOJI_RE = re.compile(
-    "[" 
+_EMOJI_RANGES = (
     "\U0001F600-\U0001F64F"
     "\U0001F300-\U0001F5FF"
     "\U0001F680-\U0001F6FF"
@@ -78,8 +102,6 @@ _EMOJI_RE = re.compile(
     "\U0001F900-\U0001F9FF"
     "\U0001FA70-\U0001FAFF"
     "\U00002600-\U000026FF"
-    "]+",
-    flags=re.UNICODE
 )
 
 # 토큰/표기 흔들림을 약하게 정규화 (너무 공격적으로 바꾸면 오탐이 늘어납니다)
@@ -93,22 +115,22 @@ NORMALIZE_TOKEN_MAP = {
     "image": "",
 }
 
-def remove_emoji(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = _EMOJI_RE.sub(" ", text)
-    text = text.replace("\uFE0F", " ").replace("\u200D", " ")
-    return text
+# (개선) 이모지/URL 제거를 한 번의 정규식 패스로 처리하고, 개행/공백 정리는 str.split()으로 합칩니다.
+# - 이모지·변이선택자(FE0F)·ZWJ(200D)는 공백처럼 취급하고, URL은 공백/이모지 앞에서 끊깁니다.
+# - " ".join(s.split()) 은 re.sub(r"\s+", " ", s).strip() 과 같습니다(같은 유니코드 공백 기준).
+#   (기존: 이모지→공백 치환 후 URL(\S+) 제거 → 개행 치환 → 공백 압축 과 결과가 같습니다 - test_text_clean.py)
+# - 본문 열에는 행마다 clean_text 를 map 합니다. .str.replace + .str.split/join 도 (pyarrow 없이는)
+#   행 단위 루프라서 오히려 느렸습니다(블로그 본문×5: map 1.5s, .str 1.9s).
+_EMOJI_CHARS = _EMOJI_RANGES + "\uFE0F\u200D"
+_CLEAN_RE = re.compile(
+    rf"[{_EMOJI_CHARS}]+|https?://[^\s{_EMOJI_CHARS}]+|www\.[^\s{_EMOJI_CHARS}]+"
+)
 
 def clean_text(text: str) -> str:
     """URL/개행/이모지 제거 + 공백 정리"""
     if not isinstance(text, str):
         return ""
-    text = remove_emoji(text)
-    text = re.sub(r"https?://\S+|www\.\S+", " ", text)
-    text = re.sub(r"[\r\n\t]+", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return " ".join(_CLEAN_RE.sub(" ", text).split())
 
 # =========================
 # 3) 좌표/구/ID 추출
@@ -138,14 +160,18 @@ def extract_place_id(place_url: str, html: str = None) -> str:
             return m.group(1)
     return ""
 
+# 괄호 묶음 제거 + 특수문자/공백 제거를 한 패스로('('는 괄호 묶음 규칙이 먼저 보도록 따로 처리)
+_NORM_RE = re.compile(r"\([^)]*\)|[^0-9a-z가-힣(]+|\(")
+
 def norm(s: str) -> str:
     """이름/주소 매칭용 정규화: 소문자 + 괄호 제거 + 특수문자 제거"""
     if not isinstance(s, str):
         return ""
-    s = s.lower()
-    s = re.sub(r"\([^)]*\)", "", s)        # 괄호 제거
-    s = re.sub(r"[^0-9a-z가-힣]+", "", s)  # 특수문자/공백 제거
-    return s
+    return _NORM_RE.sub("", s.lower())
+
+def norm_series(s: pd.Series) -> pd.Series:
+    """norm의 열 단위 버전(입력은 문자열 Series, 결측은 "")"""
+    return s.str.lower().str.replace(_NORM_RE, "", regex=True).fillna("")
 
 def safe_str(v):
     if pd.isna(v):
@@ -155,7 +181,77 @@ def safe_str(v):
 # =========================
 # 4) Kiwi 토큰화 + 불용어
 # =========================
-kiwi = Kiwi()
+# (추가) 분석기 설정: 모드 프리셋 + CLI 개별 옵션(--kiwi_model/--kiwi_typos/--kiwi_match/--kiwi_threads)
+# - default : 기존과 동일(Kiwi() 기본값)
+# - fast    : 야간 재빌드용. 다어절/오타 사전을 읽지 않고 이모지/일련번호/멘션 매칭을 끔 + 모든 코어 사용
+# - accurate: 주간 재빌드용. cong-global 모델 + 기본 오타 교정(basic)
+# - 모드별 속도/결과 차이는 bench 서브커맨드로 측정: python build_cafe_db_enriched_v5.py bench --blog_csv ...
+KIWI_MODES = {
+    "fast":     {"model": "cong", "typos": None, "match": "URL+EMAIL+HASHTAG", "multi_dict": False, "threads": -1},
+    "default":  {"model": None, "typos": None, "match": "ALL", "multi_dict": True, "threads": None},
+    "accurate": {"model": "cong-global", "typos": "basic", "match": "ALL", "multi_dict": True, "threads": None},
+}
+KIWI_TYPOS = ["none", "basic", "continual", "basic_with_continual", "lengthening", "basic_with_continual_and_lengthening"]
+
+def parse_match_options(v) -> int:
+    """'ALL' | 'URL+EMAIL+HASHTAG' | 'NONE' → Kiwi Match 비트 플래그"""
+    out = 0
+    for name in re.split(r"[+|,]", str(v).upper()):
+        name = name.strip()
+        if not name or name == "NONE":
+            continue
+        flag = getattr(Match, name, None)
+        if not isinstance(flag, int):
+            raise argparse.ArgumentTypeError(f"알 수 없는 Kiwi 매칭 옵션: {name}")
+        out |= int(flag)
+    return out
+
+def resolve_kiwi_config(mode="default", model=None, typos=None, match=None, threads=None) -> dict:
+    """모드 프리셋에 CLI 개별 옵션을 덮어쓴 분석기 설정(프로필 지문에도 들어감)"""
+    cfg = dict(KIWI_MODES[mode], mode=mode)
+    if threads is not None:
+        cfg["threads"] = threads
+    if model is not None:
+        cfg["model"] = model
+    if typos is not None:
+        cfg["typos"] = None if typos == "none" else typos
+    if match is not None:
+        cfg["match"] = match
+    cfg["match"] = parse_match_options(cfg["match"])
+    return cfg
+
+def configure_kiwi(cfg: dict):
+    """전역 분석기(kiwi)와 tokenize/split_into_sents 공통 옵션(KIWI_OPTS)을 설정대로 다시 만듭니다."""
+    global kiwi, KIWI_OPTS, KIWI_CFG
+    kw = {}
+    if cfg["model"] is not None:
+        kw["model_type"] = cfg["model"]
+    if cfg["threads"] is not None:
+        kw["num_workers"] = cfg["threads"]
+    if not cfg["multi_dict"]:
+        kw.update(load_multi_dict=False, load_typo_dict=False)
+    kiwi = Kiwi(**kw)
+    KIWI_OPTS = {}
+    if cfg["match"] != int(Match.ALL):
+        KIWI_OPTS["match_options"] = cfg["match"]
+    if cfg["typos"]:
+        KIWI_OPTS["typos"] = cfg["typos"]
+    KIWI_CFG = cfg
+
+def kiwi_fingerprint_spec():
+    """토큰화 결과를 바꾸는 설정만(스레드 수 제외). 기본 설정이면 None(기존 프로필 지문 유지)"""
+    spec = {k: KIWI_CFG[k] for k in ("model", "typos", "match", "multi_dict")}
+    default = resolve_kiwi_config()
+    return None if all(spec[k] == default[k] for k in spec) else spec
+
+def kiwi_sents(posts):
+    """글 목록 → 글마다 문장(토큰 포함) 목록(순서 유지). --kiwi_threads 가 있으면 글 단위로 병렬 분석"""
+    return kiwi.split_into_sents(posts, return_tokens=True, **KIWI_OPTS)
+
+kiwi = None
+KIWI_OPTS = {}
+KIWI_CFG = {}
+configure_kiwi(resolve_kiwi_config())
 
 BASE_STOPWORDS = set("""
 그리고 그러나 그런데 또한 그래서 그러면 하지만 때문에 위해 통해 대한 대해
@@ -281,85 +377,99 @@ ALLOWED_SINGLE = set(["빵", "차", "떡", "잼", "쌀", "귤", "밤", "팥"])
 
 _NUMERIC_RE = re.compile(r"^(?:\d+|\d{1,3}(?:,\d{3})+)(?:\.\d+)?$")  # 8000 / 8,000 / 8,000.0
 
-def kiwi_tokens(text: str, extra_stopwords=None, nouns_only=False, profile: str = "tagging"):
-    """Kiwi 토큰화 공통 함수
+def _normalize_kiwi_token(form: str, tag: str):
+    """Kiwi 토큰 1개를 공통 규칙으로 정규화합니다. (제외 대상이면 None)"""
+    if not form:
+        return None
 
-    profile:
-      - "tagging": 분위기/맛/동반인/편의시설 태깅 및 메뉴추출용(과도한 제거 금지)
-      - "top40"  : 키워드TOP40/전역 빈도용(노이즈를 한 단계 더 제거)
-    """
-    if not text:
-        return []
-    sw = BASE_STOPWORDS | DOMAIN_STOPWORDS | (extra_stopwords or set())
-    allow_exact = None
-    allow_substr = None
-    if profile == "top40":
-        sw = sw | TOP40_ONLY_STOPWORDS
-        # ✅ TOP40에는 "카페 소개용"으로 의미 있는 토큰만 남기기(화이트리스트)
-        #    - ATMOSPHERE_DICT / TASTE_DICT / COMPANION_DICT / MENU_KEYWORDS 기반
-        #    - 전세/주거/동네명 같은 잡음 유입을 구조적으로 차단
-        allow_exact, allow_substr = get_top40_allowlists()
+    # 숫자/가격 토큰은 빈도분석에서는 잡음 → 제외(가격표는 별도 함수에서 추출)
+    if _NUMERIC_RE.fullmatch(form):
+        return None
 
-    out = []
-    for tok in kiwi.tokenize(text):
-        form = tok.form.strip()
-        tag = tok.tag
+    form_l = form.lower()
+    # 숫자 제거(상호/지점 표기): 예) 미미당906 -> 미미당
+    form_l_no_num = re.sub(r"\d+", "", form_l)
+    if form_l_no_num:
+        form_l = form_l_no_num
 
-        if not form:
-            continue
+    # 토큰 정규화(가벼운 수준)
+    if form_l in NORMALIZE_TOKEN_MAP:
+        form_l = NORMALIZE_TOKEN_MAP[form_l]
+        if not form_l:
+            return None
 
-        # 숫자/가격 토큰은 빈도분석에서는 잡음 → 제외(가격표는 별도 함수에서 추출)
-        if _NUMERIC_RE.fullmatch(form):
-            continue
+    # 도로명 패턴(로/길/대로/번길 등)은 주소 노이즈 → 자동 제거
+    if _ROAD_SUFFIX_RE.fullmatch(form_l):
+        return None
 
-        form_l = form.lower()
-        # 숫자 제거(상호/지점 표기): 예) 미미당906 -> 미미당
-        form_l_no_num = re.sub(r"\d+", "", form_l)
-        if form_l_no_num:
-            form_l = form_l_no_num
+    # 동/형용사 표준화(먹다/좋다 등)
+    if tag in ("VA", "VV"):
+        form_l = form_l + "다"
+    if tag not in ("NNG", "NNP", "SL", "SN", "VA", "VV", "XR"):
+        return None
+    return form_l
+
+def _passes_top40_allowlist(form_l: str) -> bool:
+    allow_exact, allow_substr = get_top40_allowlists()
+    if form_l in allow_exact:
+        return True
+    for s in allow_substr:
+        if s and (s in form_l):
+            return True
+    return False
+
+def _expand_name_suffixes(form_l: str):
+    """상호 접미사 제거 변형(미미당 -> 미미 등) + 원형 순서로 반환"""
+    out = []
+    for suf in _NAME_SUFFIXES:
+        if form_l.endswith(suf) and len(form_l) - len(suf) >= 2:
+            out.append(form_l[:-len(suf)])
+    out.append(form_l)
+    return out
 
-        # 토큰 정규화(가벼운 수준)
-        if form_l in NORMALIZE_TOKEN_MAP:
-            form_l = NORMALIZE_TOKEN_MAP[form_l]
-            if not form_l:
-                continue
+def kiwi_base_counts(text: str) -> Counter:
+    """사전/가중치와 무관한 '기본 토큰' 빈도(접미사 확장 전, 행 단위 불용어 적용 전)
 
-        # 도로명 패턴(로/길/대로/번길 등)은 주소 노이즈 → 자동 제거
-        if _ROAD_SUFFIX_RE.fullmatch(form_l):
+    - 재채점(--rescore)용 중간 산출물의 핵심입니다.
+    - derive_profile_counts()로 tagging/top40 프로필 빈도를 Kiwi 없이 다시 만들 수 있습니다.
+      (tagging/top40 은 같은 토큰 흐름에 집합 필터만 다르게 적용하므로 결과가 동일합니다)
+    """
+    cnt = Counter()
+    if not text:
+        return cnt
+    add_base_tokens(cnt, kiwi.tokenize(text, **KIWI_OPTS))
+    return cnt
+
+def add_base_tokens(cnt: Counter, tokens):
+    """Kiwi 토큰열을 기본 토큰 빈도에 더합니다(kiwi_base_counts / 문장 추출 엔진 공용)"""
+    sw = BASE_STOPWORDS | DOMAIN_STOPWORDS
+    for tok in tokens:
+        form_l = _normalize_kiwi_token(tok.form.strip(), tok.tag)
+        if form_l is None or form_l in sw:
             continue
+        if len(form_l) == 1 and form_l not in ALLOWED_SINGLE:
+            continue
+        cnt[form_l] += 1
 
-        if nouns_only:
-            if tag not in ("NNG", "NNP"):
-                continue
-        else:
-            # 동/형용사 표준화(먹다/좋다 등)
-            if tag in ("VA", "VV"):
-                form_l = form_l + "다"
-            if tag not in ("NNG", "NNP", "SL", "SN", "VA", "VV", "XR"):
-                continue
-
-        # TOP40 전용: 화이트리스트에 없는 토큰은 제거(키워드TOP40이 40개 미만이어도 허용)
-        if profile == "top40":
-            if form_l not in allow_exact:
-                ok = False
-                for s in allow_substr:
-                    if s and (s in form_l):
-                        ok = True
-                        break
-                if not ok:
-                    continue
+def derive_profile_counts(base_cnt, extra_stopwords=None, profile: str = "tagging") -> Counter:
+    """kiwi_base_counts() 결과 → 용도별 빈도(행 불용어 + TOP40 화이트리스트 + 상호 접미사 확장)
 
+    profile:
+      - "tagging": 분위기/맛/동반인/편의시설 태깅 및 메뉴추출용(과도한 제거 금지)
+      - "top40"  : 키워드TOP40/전역 빈도용(노이즈를 한 단계 더 제거)
+    - 토큰 등장 순서(=Counter 삽입 순서)를 유지하므로 most_common 동률 순서가 실행마다 같습니다.
+    """
+    sw = extra_stopwords or set()
+    if profile == "top40":
+        sw = sw | TOP40_ONLY_STOPWORDS
+    out = Counter()
+    for form_l, c in base_cnt.items():
         if form_l in sw:
             continue
-        if len(form_l) == 1 and form_l not in ALLOWED_SINGLE:
+        if profile == "top40" and not _passes_top40_allowlist(form_l):
             continue
-
-                # 상호 접미사 제거(미미당 -> 미미 등)
-        for suf in _NAME_SUFFIXES:
-            if form_l.endswith(suf) and len(form_l) - len(suf) >= 2:
-                out.append(form_l[:-len(suf)])
-
-        out.append(form_l)
+        for t in _expand_name_suffixes(form_l):
+            out[t] += c
     return out
 
 
@@ -500,7 +610,7 @@ def _raw_tokens_for_stopwords(text: str):
     if not text:
         return []
     out = []
-    for tok in kiwi.tokenize(str(text)):
+    for tok in kiwi.tokenize(str(text), **KIWI_OPTS):
         form = tok.form.strip()
         if not form:
             continue
@@ -529,11 +639,8 @@ def _raw_tokens_for_stopwords(text: str):
 
 _PROTECTED_ROW_SW = set(MENU_KEYWORDS) | set(FACILITY_TOKENS)
 
-def build_row_stopwords(name: str, district: str, addr: str):
-    """행(row) 단위로 상호/주소/지역에서 파생되는 토큰을 불용어로 제외합니다.
-    - TOP40에서 '상호 조각(브랜드/지점명)'이 섞이는 것을 강하게 억제
-    - 주소(로/길/대로 등)는 kiwi_tokens에서 1차 필터링하되, 여기서도 보조적으로 제거
-    """
+def row_stopword_candidates(name: str, district: str, addr: str):
+    """상호/주소/지역 토큰 후보(Kiwi 사용). 보호 토큰 제외 전 단계 — 재채점용으로 저장됩니다."""
     sw = set()
 
     # 1) 상호: 분절/지점표기 제거 등 변형을 만들어 최대한 커버
@@ -558,9 +665,12 @@ def build_row_stopwords(name: str, district: str, addr: str):
         if not s:
             continue
         sw.update(_raw_tokens_for_stopwords(s))
+    return sw
 
+def finalize_row_stopwords(candidates):
+    """후보 토큰에서 보호 토큰(메뉴/편의시설)과 너무 짧은 조각을 뺀 최종 행 불용어"""
     # 보호 토큰(메뉴/편의시설)은 제거 대상에서 제외
-    sw -= _PROTECTED_ROW_SW
+    sw = set(candidates) - _PROTECTED_ROW_SW
 
     # 너무 짧은 상호 조각(잡음)을 제거
     sw = {t for t in sw if len(t) >= 2}
@@ -568,7 +678,8 @@ def build_row_stopwords(name: str, district: str, addr: str):
     return sw
 
 PARK_POS = [r"주차\s*가능", r"무료\s*주차", r"주차장", r"전용\s*주차", r"매장\s*앞\s*주차", r"공영\s*주차"]
-PARK_NEG = [r"주차\s*불가", r"주차\s*안\s*됨", r"주차\s*어려", r"주차\s*힘들", r"주차\s*불편"]
+PARK_NEG = [r"주차\s*불가", r"주차\s*안\s*됨", r"주차\s*어려", r"주차\s*힘들", r"주차\s*불편",
+            r"주차장\s*(?:이|은)?\s*(?:따로\s*)?(?:없|X\b)", r"주차\s*공간\s*(?:이|은)?\s*없"]
 
 def score_from_dict(cnt: Counter, lexicon: dict):
     scores = {}
@@ -576,11 +687,22 @@ def score_from_dict(cnt: Counter, lexicon: dict):
         scores[label] = sum(cnt.get(w, 0) for w in words)
     return [(k, v) for k, v in sorted(scores.items(), key=lambda x: x[1], reverse=True) if v > 0]
 
-def detect_parking(text: str) -> str:
-    if not text:
-        return ""
-    neg = any(re.search(p, text) for p in PARK_NEG)
-    pos = any(re.search(p, text) for p in PARK_POS)
+_PARK_POS_RE = re.compile("|".join(PARK_POS))
+_PARK_NEG_RE = re.compile("|".join(PARK_NEG))
+
+def parking_polarity(sentence: str) -> str:
+    """문장 하나의 주차 언급 판정. 한 문장에 둘 다 있으면('주차장은 있는데 주차 어려움') 부정이 우선"""
+    if _PARK_NEG_RE.search(sentence):
+        return "불가"
+    if _PARK_POS_RE.search(sentence):
+        return "가능"
+    return ""
+
+def parking_from_facts(facts) -> str:
+    """문장별 주차 판정을 카페 단위 라벨로(가능/불가/혼재(확인필요)/빈값)"""
+    pols = {f["value"] for f in facts if f["kind"] == "parking"}
+    pos = "가능" in pols
+    neg = "불가" in pols
     if pos and not neg:
         return "가능"
     if neg and not pos:
@@ -589,12 +711,12 @@ def detect_parking(text: str) -> str:
         return "혼재(확인필요)"
     return ""
 
-def extract_menus(text: str, token_counter: Counter, topk=8):
+def extract_menus(menu_hits, token_counter: Counter, topk=8):
+    """menu_hits: 본문에 등장한 메뉴키워드 집합(문장 추출 엔진의 menu fact)"""
     found = Counter()
-    if text:
-        for m in MENU_KEYWORDS:
-            if len(m) >= 2 and m in text:
-                found[m] += 1
+    for m in MENU_KEYWORDS:
+        if m in menu_hits:
+            found[m] += 1
     for m in MENU_KEYWORDS:
         found[m] += token_counter.get(m, 0)
 
@@ -655,19 +777,20 @@ def _guess_item_from_context(ctx: str):
             return m
     return ""
 
-def extract_prices(text: str, window: int = 30):
-    """
-    text에서 가격을 추출합니다.
-    - strict: '원' 포함
-    - loose: 콤마 숫자(8,000)지만, 주변에 메뉴키워드가 있을 때만 인정
+def price_candidates(text: str, window: int = 30, start: int = 0, end: int = None):
+    """가격 후보(메뉴 추정 전). MENU_KEYWORDS와 무관하므로 재채점용으로 저장됩니다.
+
+    - start/end 를 주면 그 구간(문장)에서만 찾고, context 는 text 전체에서 잘라 옵니다.
     """
     if not text:
         return []
+    if end is None:
+        end = len(text)
 
     out = []
 
     # 1) strict
-    for m in _PRICE_STRICT.finditer(text):
+    for m in _PRICE_STRICT.finditer(text, start, end):
         raw = m.group(0)
         price_raw = m.group("price")
         price_int = _to_int_price(price_raw)
@@ -677,11 +800,10 @@ def extract_prices(text: str, window: int = 30):
             continue
         s, e = m.start(), m.end()
         ctx = text[max(0, s-window):min(len(text), e+window)]
-        item = _guess_item_from_context(ctx)
-        out.append({"item": item, "price": price_int, "raw": raw, "context": ctx, "source": "strict"})
+        out.append({"price": price_int, "raw": raw, "context": ctx, "source": "strict"})
 
-    # 2) loose(원 없이 '8,000' 같은 것) - 주변에 메뉴키워드가 있을 때만
-    for m in _PRICE_LOOSE.finditer(text):
+    # 2) loose(원 없이 '8,000' 같은 것) - 메뉴키워드 확인은 finalize_prices에서
+    for m in _PRICE_LOOSE.finditer(text, start, end):
         price_raw = m.group("price")
         price_int = _to_int_price(price_raw)
         if price_int is None:
@@ -690,10 +812,18 @@ def extract_prices(text: str, window: int = 30):
             continue
         s, e = m.start(), m.end()
         ctx = text[max(0, s-window):min(len(text), e+window)]
-        item = _guess_item_from_context(ctx)
-        if not item:
+        out.append({"price": price_int, "raw": price_raw, "context": ctx, "source": "loose"})
+    return out
+
+def finalize_prices(candidates):
+    """가격 후보에 메뉴(item)를 추정하고, loose 후보는 주변에 메뉴키워드가 있을 때만 남깁니다."""
+    out = []
+    for c in candidates:
+        item = _guess_item_from_context(c["context"])
+        if c["source"] == "loose" and not item:
             continue
-        out.append({"item": item, "price": price_int, "raw": price_raw, "context": ctx, "source": "loose"})
+        out.append({"item": item, "price": c["price"], "raw": c["raw"], "context": c["context"], "source": c["source"],
+                    "sentence": c.get("sentence", "")})
 
     # 중복 제거
     seen=set()
@@ -706,6 +836,747 @@ def extract_prices(text: str, window: int = 30):
         uniq.append(r)
     return uniq
 
+# =========================
+# (추가) Kiwi 전 블로그 글 거르기(광고/목록형/스치듯 언급)
+# =========================
+# - 광고/체험단: 고지 문구를 하나의 정규식(문구 오토마톤)으로 찾고, 글은 남기되 가중치를 낮춤
+#   (토큰마다 최대 1번만 셈 - extract_post_facts 의 weak). '협찬 아님' 같은 부정은 제외.
+# - 목록형: 지도 카드(© NAVER Corp.)가 여러 개인 여러 가게 모음 글 → 제외
+# - 스치듯 언급: 상호가 본문에 없거나, 긴 글에 한 번만 나오고 가격 언급도 없음 → 제외
+#   (사전과 무관한 신호만 씀 - 판정이 남는 글과 text_hash 를 정하므로 사전 수정 후 --rescore 가 되도록)
+#   상호는 통째(지점 표기 제외)뿐 아니라 상호 낱말(2글자 이상, 지점/지역/업종 낱말 제외)로도 찾습니다.
+#   블로거는 '세컨드원 가든 광주수완점'을 '세컨드원 광주수완점'처럼 줄여 쓰기 때문입니다.
+#   같은 카페 묶음(identity)의 모든 상호 표기(네이버/카카오/블로그 검색명)를 씁니다.
+# - 카페의 글이 모두 제외되면 상호가 가장 많이 나온 글 하나는 남깁니다(태그/메뉴/가격이 비지 않도록).
+# - 정규식/문자열 세기만 쓰므로 Kiwi 토큰화 전에 돌리고, 제외된 글은 토큰화하지 않습니다.
+SPONSOR_PHRASES = [
+    r"소정의\s*원고료", r"원고료", r"체험단", r"협찬", r"제공\s*받", r"지원\s*받", r"무상\s*(?:으로\s*)?제공",
+    r"업체\s*로부터", r"광고\s*포함", r"서포터즈", r"대가\s*(?:로|를)",
+]
+_SPONSOR_RE = re.compile("(?:" + "|".join(SPONSOR_PHRASES) + r")(?!\s*(?:아님|아닌|아니|없|[xX](?![a-zA-Z])))")
+POST_LISTING_MIN_CARDS = 3       # 지도 카드가 이 이상이면 목록형
+POST_PASSING_MIN_LEN = 1500      # 상호 1회 언급 글이 이 길이 이상이면 스치듯 언급 후보
+POST_PASSING_MAX_PRICES = 0      # 그때 가격 언급이 이 이하이면 스치듯 언급
+POST_FILTER_LABELS = {"sponsored": "광고(가중↓)", "listing": "목록형(제외)", "passing": "스치듯언급(제외)"}
+POST_FILTER_DROP = {"listing", "passing"}
+
+# 상호 낱말 중 그 자체로는 카페를 가리키지 않는 것(업종/지역) - 이것만 맞으면 언급으로 보지 않음
+POST_NAME_GENERIC = {
+    "카페", "커피", "디저트", "베이커리", "브런치", "브런치카페", "베이커리카페", "디저트카페", "제과", "제과점",
+    "빵집", "케이크", "티룸", "찻집", "cafe", "coffee", "bakery", "dessert", "brunch", "the",
+} | LOCATION_STOPWORDS
+
+def post_name_keys(names) -> set:
+    """상호 표기들 → 본문(norm)에서 찾을 키: 통째 상호(지점 표기 제외) + 2글자 이상 상호 낱말"""
+    keys = set()
+    for name in names:
+        if not isinstance(name, str) or not name.strip():
+            continue
+        core = _name_core(name)
+        if core:
+            keys.add(core)
+        for word in re.split(r"[\s\-_/()\[\]{}&+·,]+", name.strip()):
+            if re.search(r"(?:호점|본점|지점|점)$", word):
+                continue  # 지점 표기(광주수완점)는 다른 지점 글에도 나옴
+            w = norm(word)
+            if len(w) >= 2 and w not in POST_NAME_GENERIC:
+                keys.add(w)
+    return keys
+
+def post_name_hits(text: str, name_keys) -> int:
+    """본문에서 상호가 언급된 횟수(키마다 센 값 중 최댓값 - 통째 상호와 그 낱말을 겹쳐 세지 않음)"""
+    t = norm(text)
+    return max((t.count(k) for k in name_keys), default=0)
+
+def classify_post(text: str, name_keys) -> str:
+    """"" | sponsored | listing | passing (정규식/문자열 세기만 사용). name_keys: post_name_keys() 결과"""
+    if not text:
+        return ""
+    if text.count("NAVER Corp") >= POST_LISTING_MIN_CARDS:
+        return "listing"
+    if name_keys:
+        hits = post_name_hits(text, name_keys)
+        if hits == 0:
+            return "passing"
+        if hits == 1 and len(text) >= POST_PASSING_MIN_LEN:
+            # 주제 밀도는 가격 언급으로만 봄: 메뉴 사전(MENU_KEYWORDS)에 기대면 사전을 고칠 때 판정 → 남는 글 →
+            # text_hash 가 바뀌어 --rescore 가 '입력이 바뀐 카페'로 멈춤
+            if len(_PRICE_STRICT.findall(text)) <= POST_PASSING_MAX_PRICES:
+                return "passing"
+    return "sponsored" if _SPONSOR_RE.search(text) else ""
+
+def keep_last_post(cafe_ids, texts, verdicts, name_keys) -> list:
+    """카페의 글이 모두 제외 판정이면, 상호가 가장 많이 나온 글(동률은 앞 글) 하나를 되살림
+
+    cafe_ids/texts/verdicts/name_keys 는 같은 길이의 글 목록(name_keys[i]: 그 글 판정에 쓴 상호 키).
+    반환: 고친 판정 목록(되살린 글은 광고 여부만 다시 봄)
+    """
+    verdicts = list(verdicts)
+    rows = defaultdict(list)
+    for i, cid in enumerate(cafe_ids):
+        rows[cid].append(i)
+    for cid, idx in rows.items():
+        if any(verdicts[i] not in POST_FILTER_DROP for i in idx):
+            continue
+        best = max(idx, key=lambda i: (verdicts[i] == "passing", post_name_hits(texts[i], name_keys[i]), -i))
+        verdicts[best] = "sponsored" if _SPONSOR_RE.search(texts[best] or "") else ""
+    return verdicts
+
+# =========================
+# (추가) 문장 단위 단일 패스 추출 엔진
+# =========================
+# - 블로그 글마다 Kiwi 문장 분리를 한 번만 하고(토큰도 같이 받음), 그 토큰으로 기본 빈도를 세면서
+#   문장마다 추출기(visitor)를 돌립니다. 주차/가격/메뉴/편의시설을 각각 본문 전체에서 다시 훑지 않습니다.
+# - 추출 결과(fact)는 {"kind", "value", "sentence"} 형태로 출처 문장을 함께 가집니다.
+# - 주차 긍/부정은 문장 안에서 판정하고(parking_polarity), 카페 라벨은 문장 판정을 모아 정합니다.
+# - 추출기 추가: visitor(post, sent) -> [fact, ...] 를 만들어 SENTENCE_VISITORS 에 등록하세요.
+FACILITY_DICT = {
+    "콘센트": ["콘센트"],
+    "와이파이": ["와이파이", "wifi"],
+    "화장실": ["화장실"],
+    "테라스": ["테라스"],
+    "루프탑": ["루프탑"],
+    "단체석": ["단체석", "대형 테이블", "대형테이블"],
+    "노키즈존": ["노키즈존", "노키즈"],
+    "반려동물": ["애견동반", "애견 동반", "반려견 동반", "반려동물 동반", "펫프렌들리"],
+    "유아의자": ["유아의자", "아기의자"],
+}
+_FACILITY_LABEL = {w.lower(): label for label, words in FACILITY_DICT.items() for w in words}
+_FACILITY_RE = re.compile("|".join(re.escape(w) for w in sorted(_FACILITY_LABEL, key=len, reverse=True)),
+                          re.IGNORECASE)
+
+def _menu_matcher(keywords):
+    """메뉴키워드(2글자 이상) 등장 여부를 한 번의 정규식 스캔으로
+
+    - 위치마다 가장 긴 키워드만 잡히므로(치즈케이크), 그 안에 든 짧은 키워드(케이크)는 미리 펼쳐 둡니다.
+    """
+    kws = sorted({m for m in keywords if len(m) >= 2}, key=len, reverse=True)
+    if not kws:
+        return None, {}
+    rx = re.compile("(?=(" + "|".join(re.escape(m) for m in kws) + "))")
+    contains = {m: [k for k in kws if k in m] for m in kws}
+    return rx, contains
+
+_MENU_RE, _MENU_CONTAINS = _menu_matcher(MENU_KEYWORDS)
+
+def menu_mentions(text: str) -> list:
+    """text 에 등장한 메뉴키워드(부분문자열 기준, 등장 순서)"""
+    if not text or _MENU_RE is None:
+        return []
+    seen = {}
+    for m in _MENU_RE.finditer(text):
+        for k in _MENU_CONTAINS[m.group(1)]:
+            seen.setdefault(k, None)
+    return list(seen)
+
+def menu_lexicon_fp() -> str:
+    """메뉴 fact 는 MENU_KEYWORDS 에 의존하므로 프로필에 지문을 같이 남깁니다(재채점 시 비교)"""
+    return hashlib.md5(json.dumps(MENU_KEYWORDS, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+def visit_parking(post, sent):
+    pol = parking_polarity(sent.text)
+    return [{"kind": "parking", "value": pol, "sentence": sent.text}] if pol else []
+
+def visit_prices(post, sent):
+    out = []
+    for c in price_candidates(post, window=35, start=sent.start, end=sent.end):
+        c.update(kind="price", value=c["price"], sentence=sent.text)
+        out.append(c)
+    return out
+
+def visit_menus(post, sent):
+    return [{"kind": "menu", "value": m, "sentence": sent.text} for m in menu_mentions(sent.text)]
+
+def visit_facilities(post, sent):
+    labels = dict.fromkeys(_FACILITY_LABEL[m.group(0).lower()] for m in _FACILITY_RE.finditer(sent.text))
+    return [{"kind": "facility", "value": label, "sentence": sent.text} for label in labels]
+
+SENTENCE_VISITORS = [visit_parking, visit_prices, visit_menus, visit_facilities]
+
+def extract_post_facts(posts, segments=None, weak=None, post_counts=None):
+    """블로그 글 목록 → (기본 토큰 빈도, fact 목록). 글마다 Kiwi 문장 분리+토큰화 1회
+
+    - segments(list)를 주면 글마다 검색 색인용 형태소 문자열(fts_segment)을 같은 토큰으로 덧붙입니다.
+    - weak[i] 가 참인 글(광고/체험단)은 가중치를 낮춰 토큰마다 최대 1번만 셉니다.
+    - post_counts(list)를 주면 글마다 기본 토큰 빈도(가중치 적용 전)를 덧붙입니다(월별 추이용).
+    """
+    cnt = Counter()
+    facts = []
+    analyzed = kiwi_sents(p for p in posts if p)
+    for i, post in enumerate(posts):
+        if not post:
+            if segments is not None:
+                segments.append("")
+            if post_counts is not None:
+                post_counts.append(Counter())
+            continue
+        sents = next(analyzed)
+        post_cnt = Counter() if (weak and weak[i]) or post_counts is not None else cnt
+        for sent in sents:
+            add_base_tokens(post_cnt, sent.tokens)
+            for visit in SENTENCE_VISITORS:
+                facts.extend(visit(post, sent))
+        if post_cnt is not cnt:
+            cnt.update(dict.fromkeys(post_cnt, 1) if weak and weak[i] else post_cnt)
+        if post_counts is not None:
+            post_counts.append(post_cnt)
+        if segments is not None:
+            segments.append(fts_segment(tok for sent in sents for tok in sent.tokens))
+    return cnt, facts
+
+# =========================
+# (추가) 검색용 SQLite(FTS5) 산출물
+# =========================
+# - 마스터 테이블(cafes) + 블로그 글(posts) + 글 본문 FTS5 색인(post_fts)을 파일 하나에 담습니다.
+# - 색인 본문은 Kiwi 형태소(내용어)를 공백으로 이은 문자열이라, 검색어도 같은 방식으로 나누면
+#   '주차가능한' → 주차/가능 처럼 형태소 단위로 맞습니다. 순위는 bm25.
+# - FTS 는 매칭/순위에만 씁니다. 발췌는 형태소 문자열이 아니라 원문(posts.text)에서, 검색 형태소가
+#   처음 나오는 자리(Kiwi 토큰의 원문 오프셋) 주변을 잘라 만듭니다.
+# - 검색: python build_cafe_db_enriched_v5.py search --db cafes_search.sqlite 주차 넓은 카페
+FTS_KEEP_TAGS = {"NNG", "NNP", "NR", "NP", "VV", "VA", "XR", "MAG", "SL", "SH", "SN"}
+
+def fts_segment(tokens) -> str:
+    out = []
+    for tok in tokens:
+        if tok.tag.split("-")[0] in FTS_KEEP_TAGS:
+            form = tok.form.strip().lower().replace(" ", "")
+            if form:
+                out.append(form)
+    return " ".join(out)
+
+def fts_segment_text(text: str) -> str:
+    return fts_segment(kiwi.tokenize(text, **KIWI_OPTS)) if text else ""
+
+def fts_terms(query: str):
+    """검색어 → 색인과 같은 방식으로 나눈 형태소(중복 제거, 순서 유지)"""
+    return list(dict.fromkeys(fts_segment_text(query).split()))
+
+def fts_query(query: str) -> str:
+    """검색어 → FTS5 MATCH 식(형태소마다 따옴표, 모두 포함=AND)"""
+    return " ".join('"' + t.replace('"', '""') + '"' for t in fts_terms(query))
+
+def fts_snippet(text: str, terms, width: int = 40) -> str:
+    """원문 발췌: 검색 형태소가 처음 나오는 자리 앞뒤 width 자, 맞은 부분은 [ ] 로 표시"""
+    terms = set(terms)
+    spans = []
+    for tok in kiwi.tokenize(text, **KIWI_OPTS):
+        if tok.tag.split("-")[0] in FTS_KEEP_TAGS and tok.form.strip().lower().replace(" ", "") in terms:
+            if not spans or tok.start >= spans[-1][1]:
+                spans.append((tok.start, tok.start + tok.len))
+    if not spans:
+        lo, hi = 0, min(len(text), 2 * width)
+    else:
+        lo = max(0, spans[0][0] - width)
+        hi = min(len(text), spans[0][1] + width)
+    out, pos = [], lo
+    for a, b in spans:
+        if a >= hi:
+            break
+        if a < lo:
+            continue
+        b = min(b, hi)
+        out += [text[pos:a], "[", text[a:b], "]"]
+        pos = b
+    out.append(text[pos:hi])
+    snip = re.sub(r"\s+", " ", "".join(out)).strip()
+    return ("… " if lo > 0 else "") + snip + (" …" if hi < len(text) else "")
+
+class SearchDbWriter:
+    """카페 루프에서 글을 바로 넣고, 마지막에 cafes 테이블을 채운 뒤 파일을 바꿔치기(원자적)"""
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = os.path.join(os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+        self.con = sqlite3.connect(self.tmp)
+        self.con.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE posts (post_id INTEGER PRIMARY KEY, cafe_id TEXT NOT NULL,
+                                link TEXT, postdate TEXT, text TEXT NOT NULL);
+            CREATE INDEX posts_cafe ON posts(cafe_id);
+            CREATE VIRTUAL TABLE post_fts USING fts5(body, tokenize = 'unicode61 remove_diacritics 0');
+        """)
+        self.n_posts = 0
+
+    def add_posts(self, cafe_id, posts):
+        """posts: [(link, postdate, 정리된 본문, 형태소 문자열)]"""
+        for link, postdate, text, seg in posts:
+            if not text:
+                continue
+            cur = self.con.execute("INSERT INTO posts (cafe_id, link, postdate, text) VALUES (?, ?, ?, ?)",
+                                   (cafe_id, safe_str(link) or None, safe_str(postdate) or None, text))
+            self.con.execute("INSERT INTO post_fts (rowid, body) VALUES (?, ?)", (cur.lastrowid, seg))
+            self.n_posts += 1
+
+    def finish(self, rows):
+        cafes = sql_master_frame(normalize_for_db(pd.DataFrame(rows)))
+        types = {"lat": "REAL", "lng": "REAL", "blog_count": "INTEGER", "reco_score": "REAL"}
+        cols = list(cafes.columns)
+        self.con.execute("CREATE TABLE cafes (" + ", ".join(
+            f"{c} {types.get(c, 'TEXT')}" + (" PRIMARY KEY" if c == "cafe_id" else "") for c in cols) + ")")
+        self.con.executemany(
+            f"INSERT INTO cafes VALUES ({', '.join('?' * len(cols))})",
+            ([None if v is None or (isinstance(v, float) and math.isnan(v)) else v for v in vals]
+             for vals in cafes.astype(object).itertuples(index=False, name=None)))
+        self.con.execute("INSERT INTO post_fts (post_fts) VALUES ('optimize')")
+        self.con.commit()
+        self.con.close()
+        os.replace(self.tmp, self.path)
+
+def search_cafes(db_path: str, query: str, limit: int = 20):
+    """형태소 검색 → [(cafe_id, cafe_name, bm25, 맞은 글 수, 가장 잘 맞은 글 발췌)] (bm25 작을수록 관련도 높음)"""
+    terms = fts_terms(query)
+    if not terms:
+        return []
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        hits = con.execute("""
+            SELECT p.cafe_id, bm25(post_fts) AS score, p.post_id
+            FROM post_fts JOIN posts p ON p.post_id = post_fts.rowid
+            WHERE post_fts MATCH ?
+            ORDER BY score
+        """, (fts_query(query),)).fetchall()
+        best = {}
+        for cafe_id, score, post_id in hits:
+            if cafe_id in best:
+                best[cafe_id][2] += 1
+            else:
+                best[cafe_id] = [score, post_id, 1]
+        ids = list(best)[:limit]
+        names = dict(con.execute(
+            f"SELECT cafe_id, cafe_name FROM cafes WHERE cafe_id IN ({', '.join('?' * len(ids))})", ids).fetchall())
+        # 발췌는 결과로 내보낼 카페의 대표 글만 원문에서 만듦
+        post_ids = [best[cid][1] for cid in ids]
+        texts = dict(con.execute(
+            f"SELECT post_id, text FROM posts WHERE post_id IN ({', '.join('?' * len(post_ids))})", post_ids).fetchall())
+    finally:
+        con.close()
+    return [(cid, names.get(cid, ""), best[cid][0], best[cid][2], fts_snippet(texts[best[cid][1]], terms))
+            for cid in ids]
+
+def run_search(argv):
+    p = argparse.ArgumentParser(prog="build_cafe_db_enriched_v5.py search",
+                                description="--out_search_db 로 만든 SQLite 에서 블로그 본문 형태소 검색(bm25 순)")
+    p.add_argument("--db", required=True)
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("query", nargs="+")
+    a = p.parse_args(argv)
+    if not os.path.exists(a.db):
+        raise SystemExit(f"[ERROR] 검색 DB가 없습니다: {a.db}")
+    query = " ".join(a.query)
+    print(f"[INFO] 검색식: {fts_query(query) or '(형태소 없음)'}")
+    for rank, (cid, name, score, n, snip) in enumerate(search_cafes(a.db, query, a.limit), 1):
+        print(f"{rank:>3}. {name} ({cid})  bm25={score:.2f}  글 {n}개  | {snip}")
+
+# =========================
+# (추가) Kiwi 분석기 모드 벤치마크
+# =========================
+# - 블로그 글 표본(카페 단위)을 모드마다 분석해 토큰/초와, default 대비 형태소·태깅·TOP40 변화량을 보고합니다.
+# - 태깅/TOP40 비교는 본 파이프라인과 같은 함수(add_base_tokens → derive_profile_counts → score_from_dict)를
+#   쓰되 상호/주소 불용어는 빼므로, 모드 간 차이만 봅니다.
+# - 실행: python build_cafe_db_enriched_v5.py bench --blog_csv */*blog_links*.csv --modes fast default accurate
+def _jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if (a or b) else 1.0
+
+def _bench_cafe_outputs(base_cnt: Counter):
+    """카페 1곳의 (태그 집합, TOP40 목록)"""
+    cnt_tag = derive_profile_counts(base_cnt, profile="tagging")
+    cnt_top = derive_profile_counts(base_cnt, profile="top40")
+    tags = set()
+    for group, lexicon in (("분위기", ATMOSPHERE_DICT), ("맛", TASTE_DICT), ("동반", COMPANION_DICT)):
+        tags.update(f"{group}:{k}" for k, _ in score_from_dict(cnt_tag, lexicon)[:3])
+    return tags, [k for k, _ in cnt_top.most_common(40)]
+
+def bench_kiwi_mode(cafe_posts):
+    """현재 분석기 설정으로 표본 분석 → (토큰 수, 초, 글마다 (형태소,품사) Counter, 카페마다 (태그, TOP40))"""
+    kiwi.tokenize("")  # 모델 지연 초기화는 측정에서 제외
+    analyzed = []
+    t0 = time.perf_counter()
+    for posts in cafe_posts:
+        analyzed.append(list(kiwi_sents(posts)))
+    elapsed = time.perf_counter() - t0
+
+    n_tokens, morphs, outputs = 0, [], []
+    for post_sents in analyzed:
+        base_cnt = Counter()
+        for sents in post_sents:
+            toks = [tok for sent in sents for tok in sent.tokens]
+            n_tokens += len(toks)
+            morphs.append(Counter((tok.form, tok.tag) for tok in toks))
+            add_base_tokens(base_cnt, toks)
+        outputs.append(_bench_cafe_outputs(base_cnt))
+    return n_tokens, elapsed, morphs, outputs
+
+def run_bench(argv):
+    p = argparse.ArgumentParser(prog="build_cafe_db_enriched_v5.py bench",
+                                description="Kiwi 분석기 모드별 속도(토큰/초)와 default 대비 태깅/TOP40 변화량 측정")
+    p.add_argument("--blog_csv", nargs="+", default=[DEFAULT_BLOG_CSV])
+    p.add_argument("--modes", nargs="+", choices=list(KIWI_MODES), default=list(KIWI_MODES))
+    p.add_argument("--sample_cafes", type=int, default=50,
+                   help="표본 카페 수(블로그 검색 상호 기준, 이름순으로 고르게 뽑음)")
+    p.add_argument("--kiwi_threads", type=int, default=None)
+    p.add_argument("--out", default=None, help="결과 CSV 경로(지정 시 저장)")
+    a = p.parse_args(argv)
+
+    blog_df = read_inputs(a.blog_csv)
+    for col in ["name", "content"]:
+        if col not in blog_df.columns:
+            blog_df[col] = ""
+    blog_df["clean_content"] = blog_df["content"].map(clean_text)
+    groups = {n: [t for t in g if t] for n, g in blog_df.groupby("name")["clean_content"]}
+    names = sorted(n for n, g in groups.items() if g)
+    if not names:
+        raise SystemExit("[ERROR] 벤치마크할 블로그 글이 없습니다")
+    step = max(1, len(names) // max(1, a.sample_cafes))
+    cafe_posts = [groups[n] for n in names[::step][:a.sample_cafes]]
+    print(f"[INFO] 표본: 카페 {len(cafe_posts)}곳, 글 {sum(map(len, cafe_posts))}개")
+
+    modes = ["default"] + [m for m in a.modes if m != "default"]
+    ref, rows = None, []
+    for mode in modes:
+        configure_kiwi(resolve_kiwi_config(mode, threads=a.kiwi_threads))
+        n_tokens, elapsed, morphs, outputs = bench_kiwi_mode(cafe_posts)
+        if ref is None:
+            ref = (n_tokens / elapsed, morphs, outputs)
+        ref_tps, ref_morphs, ref_outputs = ref
+        same = sum(sum((m & r).values()) for m, r in zip(morphs, ref_morphs))
+        total = sum(max(sum(m.values()), sum(r.values())) for m, r in zip(morphs, ref_morphs))
+        tag_j = [_jaccard(t, rt) for (t, _), (rt, _) in zip(outputs, ref_outputs)]
+        top_j = [_jaccard(k, rk) for (_, k), (_, rk) in zip(outputs, ref_outputs)]
+        rows.append({
+            "mode": mode,
+            "tokens": n_tokens,
+            "seconds": round(elapsed, 2),
+            "tokens_per_sec": round(n_tokens / elapsed),
+            "speed_vs_default": round(n_tokens / elapsed / ref_tps, 2),
+            "morph_agree": round(same / total, 4) if total else 1.0,
+            "tags_same_cafes": round(sum(j == 1.0 for j in tag_j) / len(tag_j), 4),
+            "tags_jaccard": round(sum(tag_j) / len(tag_j), 4),
+            "top40_jaccard": round(sum(top_j) / len(top_j), 4),
+            "top40_same_cafes": round(sum(j == 1.0 for j in top_j) / len(top_j), 4),
+        })
+        r = rows[-1]
+        print(f"[INFO] {mode:<8} {r['tokens_per_sec']:>8,} 토큰/초 (x{r['speed_vs_default']:.2f})  "
+              f"형태소 일치 {r['morph_agree']:.1%}  태그 동일 카페 {r['tags_same_cafes']:.1%}  "
+              f"TOP40 Jaccard {r['top40_jaccard']:.3f}")
+    if a.out:
+        to_csv_atomic(pd.DataFrame(rows), a.out, index=False, encoding="utf-8-sig")
+        print("[INFO] 저장:", a.out)
+
+# =========================
+# (추가) 토큰 정수 인코딩 + 배열 기반 빈도 저장
+# =========================
+# - 행마다 (cafe_id, 이름, 토큰) 문자열 튜플을 쌓는 대신, 토큰은 int32 id로 바꾸고
+#   (카페 번호, 토큰 id, 빈도)를 타입 배열에 저장합니다. 문자열은 CSV로 쓸 때만 만듭니다.
+# - 토큰 id는 처음 등장한 순서대로 매기므로 Counter.most_common 의 동률 순서와 같습니다.
+class TokenVocab:
+    """토큰 문자열 <-> int32 id"""
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+
+    def id(self, token: str) -> int:
+        tid = self.ids.get(token)
+        if tid is None:
+            tid = len(self.tokens)
+            self.ids[token] = tid
+            self.tokens.append(token)
+        return tid
+
+    def __len__(self):
+        return len(self.tokens)
+
+class SpaceSavingCounter:
+    """전역 토큰 빈도 상위 K 근사(Space-Saving, 고정 메모리 capacity 개)
+
+    - 감시 중인 토큰마다 (추정 빈도, 오차, 첫 등장 seq) 를 둡니다. 추정 빈도는 과대추정이며
+      참 빈도는 [count - error, count] 안에 있습니다.
+    - 꽉 찼을 때 새 토큰은 가장 작은 항목을 밀어내고 (최솟값 + c, 오차 = 최솟값) 으로 들어갑니다.
+    - merge(): 두 요약을 더하고(없는 쪽은 그 요약의 최솟값을 빈도/오차로) 상위 capacity 개만 남깁니다.
+      (샤드/지역별 요약을 합쳐도 같은 오차 보장이 유지됩니다)
+    - 한 번도 밀어내지 않았다면(vocab <= capacity) 결과는 정확값과 같습니다.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self.items = {}     # token -> [count, error, first_seq]
+        self.heap = []      # (count, token) - 지연 삭제 최소 힙
+        self.total = 0
+        self.evicted = False
+
+    def _floor(self) -> int:
+        """감시 밖 토큰의 빈도 상한(꽉 차 있으면 최솟값, 아니면 0)"""
+        if len(self.items) < self.capacity:
+            return 0
+        self._clean_heap()
+        return self.heap[0][0]
+
+    def _clean_heap(self):
+        items = self.items
+        while self.heap and items.get(self.heap[0][1], (None,))[0] != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def add(self, token: str, c: int, seq: int):
+        self.total += c
+        ent = self.items.get(token)
+        if ent is not None:
+            ent[0] += c
+        elif len(self.items) < self.capacity:
+            ent = self.items[token] = [c, 0, seq]
+        else:
+            self._clean_heap()
+            floor, victim = heapq.heappop(self.heap)
+            del self.items[victim]
+            self.evicted = True
+            ent = self.items[token] = [floor + c, floor, seq]
+        heapq.heappush(self.heap, (ent[0], token))
+        # 빈도가 바뀔 때마다 낡은 항목이 힙에 남으므로, 감시 항목 수의 8배를 넘으면 현재 값으로 다시 만듦
+        # (밀어내기가 없어도 힙이 행 수만큼 자라지 않도록)
+        if len(self.heap) > 8 * self.capacity:
+            self.heap = [(v[0], t) for t, v in self.items.items()]
+            heapq.heapify(self.heap)
+
+    def merge(self, other: "SpaceSavingCounter"):
+        f1, f2 = self._floor(), other._floor()
+        merged = {}
+        for t in self.items.keys() | other.items.keys():
+            a = self.items.get(t, [f1, f1, None])
+            b = other.items.get(t, [f2, f2, None])
+            seqs = [x for x in (a[2], b[2]) if x is not None]
+            merged[t] = [a[0] + b[0], a[1] + b[1], min(seqs)]
+        keep = sorted(merged.items(), key=lambda kv: (-kv[1][0], kv[1][2]))
+        self.evicted = self.evicted or other.evicted or len(keep) > self.capacity
+        self.items = dict(keep[:self.capacity])
+        self.heap = [(v[0], t) for t, v in self.items.items()]
+        heapq.heapify(self.heap)
+        self.total += other.total
+
+    def top(self, k: int):
+        """[(token, count, error, guaranteed)] (빈도 내림차순, 동률은 첫 등장 순)
+
+        guaranteed: 하한(count - error)이 상위 k 밖 후보들의 상한 이상 → 참 상위 k 에 반드시 포함
+        """
+        ranked = sorted(self.items.items(), key=lambda kv: (-kv[1][0], kv[1][2]))
+        outside = max(ranked[k][1][0] if len(ranked) > k else 0, self._floor())
+        return [(t, v[0], v[1], v[0] - v[1] >= outside) for t, v in ranked[:k]]
+
+    def to_json(self) -> dict:
+        return {"capacity": self.capacity, "total": self.total, "evicted": self.evicted,
+                "items": [[t, *v] for t, v in self.items.items()]}
+
+    @classmethod
+    def from_json(cls, d: dict) -> "SpaceSavingCounter":
+        sk = cls(d["capacity"])
+        sk.total = d["total"]
+        sk.evicted = d["evicted"]
+        sk.items = {t: [c, e, q] for t, c, e, q in d["items"]}
+        sk.heap = [(v[0], t) for t, v in sk.items.items()]
+        heapq.heapify(sk.heap)
+        return sk
+
+    def write_csv(self, path: str, topk: int):
+        top = self.top(topk)
+        to_csv_atomic(pd.DataFrame(top, columns=["token", "count", "error", "guaranteed"]).astype({"guaranteed": int}),
+                      path, index=False, encoding="utf-8-sig")
+        max_err = max((e for _, _, e, _ in top), default=0)
+        print(f"[INFO] 전역 빈도(근사, Space-Saving {self.capacity}칸): 상위 {len(top)}개 중 확정 {sum(g for *_, g in top)}개, "
+              f"최대 오차 {max_err} (전체 {self.total}회, 감시 밖 토큰 빈도 ≤ {self._floor()})"
+              + ("" if self.evicted else " - 밀어낸 토큰 없음: 정확값과 동일"))
+
+class TokenFreqStore:
+    """카페별 TOP40 프로필 빈도 + 전역 빈도(토큰 id 기준 배열)
+
+    memory_budget(바이트)을 주면, 메모리 사용 추정치가 이를 넘을 때마다 지금까지의 빈도를
+    정렬된 run 파일로 디스크에 내보내고(spill) 비웁니다. 마지막에 run들을 k-way 병합해
+    메모리 경로와 완전히 같은 CSV를 스트리밍으로 씁니다.
+
+    run 의 seq(동률 정렬 기준)는 (카페 순번 << 32) | 카페 안 순번 이라서, 샤드별로 따로 만든
+    run 도 전체 실행과 같은 순서로 병합됩니다(add_cafe 의 ordinal = 전체 카페 순번).
+    """
+    # 토큰 1개를 vocab(dict + list)에 넣을 때의 대략적인 추가 비용(문자열 제외)
+    _VOCAB_ENTRY_BYTES = 120
+
+    def __init__(self, memory_budget: int = None, spill_dir: str = None, sketch: SpaceSavingCounter = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.sketch = sketch    # 있으면 전역 빈도는 정확 집계 대신 이 근사 요약으로
+        self.freq_runs = []
+        self.global_runs = []
+        self.n_cafes = 0        # 지금까지 넣은 카페 수(ordinal 기본값)
+        self._reset()
+
+    def _reset(self):
+        self.vocab = TokenVocab()
+        self.cafe_ids = []
+        self.cafe_names = []
+        self.cafe_ord = array("q")    # 카페의 전체 순번
+        self.cafe_start = array("q")  # 카페 첫 행의 chunk 내 순번
+        self.cafe_idx = array("i")
+        self.token_id = array("i")
+        self.count = array("i")
+        self.global_count = array("q")
+        self.first_row = array("q")   # 토큰이 처음 나온 행의 chunk 내 순번
+        self.nbytes = 0
+
+    def add_cafe(self, cafe_id, name, counter, ordinal: int = None):
+        ci = len(self.cafe_ids)
+        self.cafe_ids.append(cafe_id)
+        self.cafe_names.append(name)
+        self.cafe_ord.append(self.n_cafes if ordinal is None else int(ordinal))
+        self.cafe_start.append(len(self.count))
+        self.n_cafes += 1
+        for token, c in counter.items():
+            n_vocab = len(self.vocab)
+            tid = self.vocab.id(token)
+            if tid == n_vocab:
+                self.nbytes += sys.getsizeof(token) + self._VOCAB_ENTRY_BYTES + 16
+            if self.sketch is not None:
+                self.sketch.add(token, int(c), self._row_seq(len(self.count), ci))
+            else:
+                if tid == len(self.global_count):
+                    self.global_count.append(0)
+                    self.first_row.append(len(self.count))
+                self.global_count[tid] += int(c)
+            self.cafe_idx.append(ci)
+            self.token_id.append(tid)
+            self.count.append(int(c))
+        self.nbytes += 12 * len(counter) + sys.getsizeof(cafe_id) + sys.getsizeof(name) + 16
+        if self.memory_budget and self.nbytes > self.memory_budget:
+            self.spill()
+
+    def _sorted_order(self):
+        """(이름 오름차순, 빈 이름은 마지막) → 빈도 내림차순 → 입력 순서"""
+        cafe_idx = np.frombuffer(self.cafe_idx, dtype=np.int32)
+        count = np.frombuffer(self.count, dtype=np.int32)
+        names = sorted({n for n in self.cafe_names if n is not None})
+        name_code = {n: i for i, n in enumerate(names)}
+        cafe_name_code = np.array([name_code.get(n, -1) for n in self.cafe_names], dtype=np.int32)
+        cafe_rank = np.where(cafe_name_code < 0, len(names), cafe_name_code)
+        return np.lexsort((-count.astype(np.int64), cafe_rank[cafe_idx])), names, cafe_name_code
+
+    def freq_df(self) -> pd.DataFrame:
+        """cafe_token_freq: 이름 오름차순(빈 이름은 마지막) → 빈도 내림차순, 동률은 입력 순서"""
+        order, names, cafe_name_code = self._sorted_order()
+        cafe_idx = np.frombuffer(self.cafe_idx, dtype=np.int32)[order]
+        token_id = np.frombuffer(self.token_id, dtype=np.int32)[order]
+        count = np.frombuffer(self.count, dtype=np.int32)[order]
+        id_codes, id_uniques = pd.factorize(np.asarray(self.cafe_ids, dtype=object))
+        return pd.DataFrame({
+            "cafe_id": pd.Categorical.from_codes(id_codes[cafe_idx], categories=id_uniques),
+            "name": pd.Categorical.from_codes(cafe_name_code[cafe_idx], categories=names),
+            "token": pd.Categorical.from_codes(token_id, categories=self.vocab.tokens),
+            "count": count.astype(np.int64),
+        })
+
+    def global_df(self, topk: int = 300) -> pd.DataFrame:
+        counts = np.frombuffer(self.global_count, dtype=np.int64)
+        top = np.argsort(-counts, kind="stable")[:topk]
+        return pd.DataFrame({
+            "token": [self.vocab.tokens[i] for i in top],
+            "count": counts[top],
+        }, columns=["token", "count"])
+
+    # ---- spill / merge ----
+    def _row_seq(self, i: int, ci: int = None) -> int:
+        if ci is None:
+            ci = self.cafe_idx[i]
+        return (self.cafe_ord[ci] << 32) | (i - self.cafe_start[ci])
+
+    def spill(self):
+        """현재 chunk를 정렬된 run 파일 2개(카페별/전역)로 내보내고 비웁니다."""
+        if not len(self.count):
+            return
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="freq_spill_")
+        k = len(self.freq_runs)
+
+        order, _, _ = self._sorted_order()
+        path = os.path.join(self.spill_dir, f"freq_{k:05d}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f, lineterminator="\n")
+            for i in order.tolist():
+                ci = self.cafe_idx[i]
+                name = self.cafe_names[ci]
+                w.writerow([0 if name is not None else 1, name or "", self.cafe_ids[ci],
+                            self.vocab.tokens[self.token_id[i]], self.count[i], self._row_seq(i)])
+        self.freq_runs.append(path)
+
+        if self.sketch is None:
+            path = os.path.join(self.spill_dir, f"global_{k:05d}.csv")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                w = csv.writer(f, lineterminator="\n")
+                for tid in sorted(range(len(self.vocab)), key=self.vocab.tokens.__getitem__):
+                    w.writerow([self.vocab.tokens[tid], self.global_count[tid], self._row_seq(self.first_row[tid])])
+            self.global_runs.append(path)
+
+        self._reset()
+
+    @staticmethod
+    def _read_freq_run(path):
+        with open(path, encoding="utf-8", newline="") as f:
+            for flag, name, cafe_id, token, c, seq in csv.reader(f):
+                c = int(c)
+                yield (int(flag), name, -c, int(seq), cafe_id, token, c)
+
+    @staticmethod
+    def _read_global_run(path):
+        with open(path, encoding="utf-8", newline="") as f:
+            for token, c, seq in csv.reader(f):
+                yield (token, int(c), int(seq))
+
+    def write_freq_csv(self, path: str):
+        if not self.freq_runs:
+            # spill 경로(csv.writer)와 줄바꿈을 맞춤(Windows 에서도 두 경로/샤드 병합 결과가 같은 바이트)
+            to_csv_atomic(self.freq_df(), path, index=False, encoding="utf-8-sig", lineterminator="\n")
+            return
+        self.spill()
+        with atomic_output(path) as tmp:
+            with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+                w = csv.writer(f, lineterminator="\n")
+                w.writerow(["cafe_id", "name", "token", "count"])
+                for flag, name, _, _, cafe_id, token, c in heapq.merge(*map(self._read_freq_run, self.freq_runs)):
+                    w.writerow([cafe_id, None if flag else name, token, c])
+
+    def write_global_csv(self, path: str, topk: int = 300):
+        if self.sketch is not None:
+            self.sketch.write_csv(path, topk)
+            return
+        if not self.global_runs:
+            to_csv_atomic(self.global_df(topk), path, index=False, encoding="utf-8-sig")
+            return
+        self.spill()
+        # 토큰 순으로 병합하며 합산 → (빈도 내림차순, 첫 등장 순) 상위 topk 만 힙으로 유지
+        top = []
+        cur, cur_c, cur_seq = None, 0, 0
+        for token, c, seq in itertools.chain(heapq.merge(*map(self._read_global_run, self.global_runs)),
+                                             [(None, 0, 0)]):
+            if token == cur:
+                cur_c += c
+                cur_seq = min(cur_seq, seq)
+                continue
+            if cur is not None:
+                item = (cur_c, -cur_seq, cur)
+                if len(top) < topk:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+            cur, cur_c, cur_seq = token, c, seq
+        top.sort(reverse=True)
+        to_csv_atomic(pd.DataFrame([(t, c) for c, _, t in top], columns=["token", "count"]),
+                      path, index=False, encoding="utf-8-sig")
+
+    def cleanup(self):
+        if self.spill_dir and os.path.isdir(self.spill_dir):
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+def parse_size(v) -> int:
+    """'512MB' / '2g' / '1048576' -> 바이트"""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*", str(v).lower())
+    if not m:
+        raise argparse.ArgumentTypeError(f"크기 형식이 아닙니다: {v} (예: 512MB, 2GB)")
+    return int(float(m.group(1)) * 1024 ** " kmgt".index(m.group(2) or " "))
+
 # =========================
 # DB NULL 정규화 함수
 # =========================
@@ -714,6 +1585,17 @@ def normalize_for_db(df: pd.DataFrame):
     df = df.replace({"": None, "nan": None, "NaN": None})
     return df
 
+def sql_master_frame(db_df: pd.DataFrame) -> pd.DataFrame:
+    """마스터 DF → DB 컬럼명(KOR_TO_SQL_COL) + 숫자형 캐스팅(MySQL/SQLite 공용)"""
+    out = db_df.rename(columns=KOR_TO_SQL_COL)
+
+    # (권장) 숫자형으로 캐스팅 (MySQL에서 DECIMAL/INT로 넣을 때 유리)
+    out["lat"] = pd.to_numeric(out["lat"], errors="coerce")
+    out["lng"] = pd.to_numeric(out["lng"], errors="coerce")
+    out["blog_count"] = pd.to_numeric(out["blog_count"], errors="coerce")
+    out["reco_score"] = pd.to_numeric(out["reco_score"], errors="coerce")
+    return out
+
 def df_mysql_ready(df: pd.DataFrame) -> pd.DataFrame:
     """
     MySQL LOAD DATA INFILE 친화적으로:
@@ -734,14 +1616,564 @@ def export_mysql_csv(df: pd.DataFrame, path: str):
     - \\N 이 따옴표로 감싸지지 않도록 QUOTE_MINIMAL
     - MySQL ESCAPED BY '\\\\' 와 맞춤
     """
-    df.to_csv(
-        path,
-        index=False,
-        encoding="utf-8",          # ✅ utf-8-sig(BOM) 금지
-        lineterminator="\n",
-        quoting=csv.QUOTE_MINIMAL,
-        escapechar="\\"
-    )
+    with atomic_output(path) as tmp:
+        df.to_csv(
+            tmp,
+            index=False,
+            encoding="utf-8",          # ✅ utf-8-sig(BOM) 금지
+            lineterminator="\n",
+            quoting=csv.QUOTE_MINIMAL,
+            escapechar="\\"
+        )
+
+# =========================
+# (추가) 원자적 파일 쓰기 + 체크포인트
+# =========================
+# - 출력은 같은 폴더의 임시 파일에 다 쓴 뒤 os.replace 로 바꿔치기합니다.
+#   (읽는 쪽은 이전 파일 또는 완성된 새 파일만 보게 됩니다)
+@contextmanager
+def atomic_output(path: str):
+    tmp = os.path.join(os.path.dirname(os.path.abspath(path)),
+                       f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def to_csv_atomic(df: pd.DataFrame, path: str, **kwargs):
+    with atomic_output(path) as tmp:
+        df.to_csv(tmp, **kwargs)
+
+class ProfileCheckpoint:
+    """완료된 카페의 프로필을 한 줄씩 덧붙이는 체크포인트(JSONL, append-only)
+
+    - 프로세스가 중간에 죽어도 여기까지 끝난 카페는 --resume 으로 건너뜁니다.
+    - every 곳마다 fsync 로 디스크에 확정합니다.
+    """
+    def __init__(self, path: str, resume: bool = False, every: int = 20):
+        self.path = path
+        self.every = max(1, int(every))
+        self.n = 0
+        if resume:
+            self._drop_partial_line(path)
+        self.f = open(path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def _drop_partial_line(path: str):
+        """중간에 죽어 잘린 마지막 줄을 잘라냄(새 레코드가 그 뒤에 붙어 함께 버려지지 않도록)"""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                i = chunk.rfind(b"\n")
+                if i >= 0:
+                    pos = pos - step + i + 1
+                    break
+                pos -= step
+            if pos < size:
+                f.truncate(pos)
+
+    def add(self, rec: dict):
+        self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.f.flush()
+        self.n += 1
+        if self.n % self.every == 0:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+# =========================
+# (추가) DB 증분 적재(이전 스냅샷 대비 insert/update/delete 만)
+# =========================
+# - 테이블별로 cafe_id 단위 내용 해시(md5)를 스냅샷으로 남겨 두고, 다음 실행에서 해시가 달라진
+#   카페만 증분으로 내보냅니다.
+#     snapshot.json         마지막으로 "적용된" 상태(적용 성공 후에만 바뀜)
+#     snapshot.pending.json 이번 실행 결과 상태(적용되면 snapshot.json 이 됨)
+#     delta.sql             MySQL 스크립트(검토/mysql CLI 용), delta.jsonl: 적용기(apply-delta)가 읽는 같은 내용
+#     schema.sql            기대하는 테이블 DDL(PK 포함)
+# - 증분은 항상 "적용된 스냅샷 → 이번 결과" 차이라서, 적용 없이 여러 번 돌려도 앞선 변경이 사라지지 않습니다
+#   (마지막 delta 가 그동안의 변경을 모두 담음). 문장은 모두 멱등(upsert / 지우고 다시 넣기)입니다.
+# - 마스터는 upsert(INSERT ... ON DUPLICATE KEY UPDATE → cafe_id PRIMARY KEY 필요),
+#   자식 테이블(토큰빈도/가격항목)은 바뀐 카페 행을 지우고 다시 넣습니다.
+# - 적용: --delta_apply SINK(빌드 직후) 또는 apply-delta 서브커맨드. SINK = mysql(pymysql, DB_* 환경변수/
+#   --db_env 파일 - backend/.env 와 같은 키) | sqlite:경로(로컬 미러, 테이블 자동 생성)
+# - 테이블명은 --sql_table_master/--sql_table_freq/--sql_table_price 로 바꿉니다. 기본값은 적재용 테이블이며
+#   백엔드가 읽는 cafes(다른 컬럼 구성)와는 별개입니다.
+DELTA_SNAPSHOT = "snapshot.json"
+DELTA_PENDING = "snapshot.pending.json"
+DELTA_SQL = "delta.sql"
+DELTA_OPS = "delta.jsonl"
+DELTA_APPLIED_SQL = "delta.applied.sql"
+DELTA_SCHEMA = "schema.sql"
+DELTA_SQL_BATCH = 500
+
+SQL_TABLE_MASTER = "cafe_master"
+SQL_TABLE_FREQ   = "cafe_token_freq"
+SQL_TABLE_PRICE  = "cafe_price_items"
+
+# schema.sql 의 컬럼 타입(없으면 TEXT)
+SQL_COL_TYPES = {
+    "cafe_id": "VARCHAR(64) NOT NULL",
+    "lat": "DOUBLE", "lng": "DOUBLE",
+    "blog_count": "INT", "reco_score": "DOUBLE",
+    "token": "VARCHAR(191) NOT NULL", "count": "INT",
+    "price": "INT",
+}
+
+PRICE_ITEM_SQL_COL = {
+    "카페id": "cafe_id",
+    "카페이름": "cafe_name",
+    "item(추정)": "item",
+    "price(원)": "price",
+    "raw": "raw",
+    "source": "source",
+    "context": "context",
+}
+
+def _sql_value(v):
+    """DB에 들어갈 값으로 정규화(빈값/NaN/\\N → None, 나머지는 문자열)"""
+    if v is None or v == MYSQL_NULL or v == "":
+        return None
+    if isinstance(v, float):
+        if math.isnan(v):
+            return None
+        return repr(int(v)) if v.is_integer() else repr(v)
+    return str(v)
+
+def _sql_literal(v) -> str:
+    if v is None:
+        return "NULL"
+    s = v.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r").replace("\0", "\\0")
+    return "'" + s + "'"
+
+def hash_rows_by_cafe(rows, cols):
+    """(cafe_id, [값...]) 스트림 → {cafe_id: md5}. 같은 카페 행은 나온 순서대로 이어서 해시"""
+    hashes = {}
+    for cid, vals in rows:
+        h = hashes.get(cid)
+        if h is None:
+            h = hashes[cid] = hashlib.md5("\x1f".join(cols).encode("utf-8"))
+        h.update(json.dumps(vals, ensure_ascii=False).encode("utf-8"))
+    return {cid: h.hexdigest() for cid, h in hashes.items()}
+
+def diff_snapshot(old: dict, new: dict):
+    inserted = {cid for cid in new if cid not in old}
+    updated = {cid for cid in new if cid in old and old[cid] != new[cid]}
+    deleted = {cid for cid in old if cid not in new}
+    return inserted, updated, deleted
+
+def _sql_insert_batches(table, cols, rows, upsert=False):
+    col_sql = ", ".join(f"`{c}`" for c in cols)
+    tail = ""
+    if upsert:
+        tail = "\nON DUPLICATE KEY UPDATE " + ", ".join(f"`{c}`=VALUES(`{c}`)" for c in cols[1:])
+    batch = []
+    for vals in rows:
+        batch.append("(" + ", ".join(_sql_literal(v) for v in vals) + ")")
+        if len(batch) >= DELTA_SQL_BATCH:
+            yield f"INSERT INTO `{table}` ({col_sql}) VALUES\n" + ",\n".join(batch) + tail + ";\n"
+            batch = []
+    if batch:
+        yield f"INSERT INTO `{table}` ({col_sql}) VALUES\n" + ",\n".join(batch) + tail + ";\n"
+
+def _sql_delete(table, cafe_ids):
+    ids = sorted(cafe_ids)
+    for i in range(0, len(ids), DELTA_SQL_BATCH):
+        yield f"DELETE FROM `{table}` WHERE `cafe_id` IN (" + ", ".join(_sql_literal(c) for c in ids[i:i + DELTA_SQL_BATCH]) + ");\n"
+
+def delta_schema_sql(tables) -> str:
+    """tables: [(테이블명, 컬럼목록, mode)] → MySQL DDL
+    - upsert 테이블: PRIMARY KEY(cafe_id) (ON DUPLICATE KEY UPDATE 가 이 키로 동작)
+    - replace 테이블: 카페 단위로 지우므로 cafe_id 인덱스(+ 토큰빈도는 (cafe_id, token) PK)
+    """
+    out = ["SET NAMES utf8mb4;\n"]
+    for table, cols, mode in tables:
+        defs = [f"  `{c}` {SQL_COL_TYPES.get(c, 'TEXT')}" for c in cols]
+        if mode == "upsert":
+            defs.append("  PRIMARY KEY (`cafe_id`)")
+        elif "token" in cols:
+            defs.append("  PRIMARY KEY (`cafe_id`, `token`)")
+        else:
+            defs.insert(0, "  `id` BIGINT NOT NULL AUTO_INCREMENT")
+            defs += ["  PRIMARY KEY (`id`)", "  KEY `idx_cafe_id` (`cafe_id`)"]
+        out.append(f"\nCREATE TABLE IF NOT EXISTS `{table}` (\n" + ",\n".join(defs)
+                   + "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n")
+    return "".join(out)
+
+def build_db_delta(delta_dir: str, tables):
+    """tables: [(테이블명, 컬럼목록, rows_fn, mode)]
+    - rows_fn() 은 (cafe_id, [값...]) 를 출력 순서대로 내는 이터레이터(두 번 호출됨: 해시 / 증분 생성)
+    - mode: "upsert"(카페당 1행, 마스터) | "replace"(카페당 여러 행, 지우고 다시 넣기)
+    - 기준은 적용된 스냅샷(snapshot.json). 결과 상태는 snapshot.pending.json 에 두고 적용 시 교체합니다.
+    반환: {테이블명: (insert, update, delete, 증분 행수, 전체 행수)}
+    """
+    os.makedirs(delta_dir, exist_ok=True)
+    snap_path = os.path.join(delta_dir, DELTA_SNAPSHOT)
+    old_snap = {}
+    if os.path.exists(snap_path):
+        with open(snap_path, encoding="utf-8") as f:
+            old_snap = json.load(f).get("tables", {})
+
+    new_snap, stats, plans = {}, {}, []
+    for table, cols, rows_fn, mode in tables:
+        n_full = [0]
+        def normalized():
+            for cid, vals in rows_fn():
+                n_full[0] += 1
+                yield cid, [_sql_value(v) for v in vals]
+        new_hashes = hash_rows_by_cafe(normalized(), cols)
+        ins, upd, dele = diff_snapshot(old_snap.get(table, {}), new_hashes)
+        new_snap[table] = new_hashes
+        plans.append((table, cols, rows_fn, mode, ins, upd, dele))
+        stats[table] = [len(ins), len(upd), len(dele), 0, n_full[0]]
+
+    with atomic_output(os.path.join(delta_dir, DELTA_SCHEMA)) as tmp:
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write(delta_schema_sql([(t, c, m) for t, c, _, m, *_ in plans]))
+
+    with atomic_output(os.path.join(delta_dir, DELTA_SQL)) as tmp_sql, \
+         atomic_output(os.path.join(delta_dir, DELTA_OPS)) as tmp_ops:
+        with open(tmp_sql, "w", encoding="utf-8", newline="\n") as f, \
+             open(tmp_ops, "w", encoding="utf-8", newline="\n") as ops:
+            def op(**kw):
+                ops.write(json.dumps(kw, ensure_ascii=False) + "\n")
+            f.write("SET NAMES utf8mb4;\nSTART TRANSACTION;\n")
+            for table, cols, rows_fn, mode, ins, upd, dele in plans:
+                op(op="table", table=table, cols=cols, mode=mode)
+                changed = ins | upd
+                st = stats[table]
+                if not (changed or dele):
+                    continue
+                f.write(f"\n-- {table}: insert {st[0]}, update {st[1]}, delete {st[2]}\n")
+                # 새 카페(insert)는 지울 행이 없으므로 update/delete 카페만
+                to_delete = sorted(dele if mode == "upsert" else upd | dele)
+                for k in range(0, len(to_delete), DELTA_SQL_BATCH):
+                    op(op="delete", table=table, ids=to_delete[k:k + DELTA_SQL_BATCH])
+                for stmt in _sql_delete(table, to_delete):
+                    f.write(stmt)
+                st[3] += len(to_delete)
+
+                batch = []
+                def changed_rows():
+                    for cid, vals in rows_fn():
+                        if cid in changed:
+                            st[3] += 1
+                            row = [_sql_value(v) for v in vals]
+                            batch.append(row)
+                            if len(batch) >= DELTA_SQL_BATCH:
+                                op(op=mode, table=table, rows=batch[:])
+                                batch.clear()
+                            yield row
+                for stmt in _sql_insert_batches(table, cols, changed_rows(), upsert=(mode == "upsert")):
+                    f.write(stmt)
+                if batch:
+                    op(op=mode, table=table, rows=batch)
+            f.write("\nCOMMIT;\n")
+
+    with atomic_output(os.path.join(delta_dir, DELTA_PENDING)) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "tables": new_snap}, f, ensure_ascii=False, sort_keys=True)
+    return {t: tuple(v) for t, v in stats.items()}
+
+def _read_env_file(path: str) -> dict:
+    """KEY=VALUE 형식(.env) → dict (주석/빈 줄/따옴표 처리)"""
+    env = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            k, v = line.split("=", 1)
+            env[k.strip()] = v.strip().strip('"').strip("'")
+    return env
+
+def _delta_sink(sink: str, db_env: str = None):
+    """SINK → (연결, 자리표시자, upsert 문 생성 함수)"""
+    if sink.startswith("sqlite:"):
+        con = sqlite3.connect(sink[len("sqlite:"):], isolation_level=None)
+        def upsert_sql(table, cols):
+            names = ", ".join(f'"{c}"' for c in cols)
+            sets = ", ".join(f'"{c}"=excluded."{c}"' for c in cols[1:])
+            return (f'INSERT INTO "{table}" ({names}) VALUES ({", ".join("?" * len(cols))}) '
+                    f'ON CONFLICT("cafe_id") DO UPDATE SET {sets}')
+        return con, "?", upsert_sql
+    if sink == "mysql":
+        try:
+            import pymysql  # 선택: mysql 적용에만 필요
+        except ImportError:
+            raise SystemExit("[ERROR] --delta_apply mysql 에는 pymysql 이 필요합니다(pip install pymysql). "
+                             "또는 mysql 클라이언트로 delta.sql 을 실행한 뒤 apply-delta --mark_applied 하세요")
+        env = dict(os.environ)
+        if db_env:
+            env.update(_read_env_file(db_env))
+        missing = [k for k in ("DB_HOST", "DB_USER", "DB_NAME") if not env.get(k)]
+        if missing:
+            raise SystemExit(f"[ERROR] DB 접속 정보가 없습니다: {', '.join(missing)} (환경변수 또는 --db_env)")
+        con = pymysql.connect(host=env["DB_HOST"], port=int(env.get("DB_PORT") or 3306), user=env["DB_USER"],
+                              password=env.get("DB_PASSWORD", ""), database=env["DB_NAME"], charset="utf8mb4",
+                              autocommit=False)
+        def upsert_sql(table, cols):
+            names = ", ".join(f"`{c}`" for c in cols)
+            sets = ", ".join(f"`{c}`=VALUES(`{c}`)" for c in cols[1:])
+            return f"INSERT INTO `{table}` ({names}) VALUES ({', '.join(['%s'] * len(cols))}) ON DUPLICATE KEY UPDATE {sets}"
+        return con, "%s", upsert_sql
+    raise SystemExit(f"[ERROR] 알 수 없는 적용 대상: {sink} (mysql | sqlite:경로)")
+
+def _mark_delta_applied(delta_dir: str):
+    """적용 성공 → 결과 상태를 기준 스냅샷으로, delta.sql 은 delta.applied.sql 로(감사용)"""
+    os.replace(os.path.join(delta_dir, DELTA_PENDING), os.path.join(delta_dir, DELTA_SNAPSHOT))
+    os.replace(os.path.join(delta_dir, DELTA_SQL), os.path.join(delta_dir, DELTA_APPLIED_SQL))
+    os.remove(os.path.join(delta_dir, DELTA_OPS))
+
+def apply_db_delta(delta_dir: str, sink: str, db_env: str = None) -> int:
+    """delta.jsonl 을 한 트랜잭션으로 적용하고, 성공하면 스냅샷을 전진시킵니다. 반환: 적용한 행+삭제 카페 수"""
+    if not os.path.exists(os.path.join(delta_dir, DELTA_PENDING)):
+        print(f"[INFO] 적용할 증분이 없습니다: {delta_dir}")
+        return 0
+    con, ph, upsert_sql = _delta_sink(sink, db_env)
+    is_sqlite = sink.startswith("sqlite:")
+    cur = con.cursor()
+    specs, n = {}, 0
+    try:
+        if is_sqlite:
+            cur.execute("BEGIN")
+        for rec in _iter_jsonl(os.path.join(delta_dir, DELTA_OPS)):
+            table = rec["table"]
+            if rec["op"] == "table":
+                specs[table] = rec["cols"]
+                if is_sqlite:
+                    # 로컬 미러: 테이블이 없으면 같은 키 구조로 생성(타입은 SQLite 동적 타입)
+                    cols = ", ".join(f'"{c}"' for c in rec["cols"])
+                    key = ', PRIMARY KEY ("cafe_id")' if rec["mode"] == "upsert" else ""
+                    cur.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols}{key})')
+                    if rec["mode"] != "upsert":
+                        cur.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_cafe_id" ON "{table}" ("cafe_id")')
+                continue
+            q = '"' if is_sqlite else "`"
+            if rec["op"] == "delete":
+                cur.execute(f"DELETE FROM {q}{table}{q} WHERE {q}cafe_id{q} IN ({', '.join([ph] * len(rec['ids']))})",
+                            rec["ids"])
+                n += len(rec["ids"])
+                continue
+            cols = specs[table]
+            if rec["op"] == "upsert":
+                sql = upsert_sql(table, cols)
+            else:
+                sql = (f"INSERT INTO {q}{table}{q} ({', '.join(q + c + q for c in cols)}) "
+                       f"VALUES ({', '.join([ph] * len(cols))})")
+            cur.executemany(sql, rec["rows"])
+            n += len(rec["rows"])
+        if is_sqlite:
+            cur.execute("COMMIT")
+        else:
+            con.commit()
+    except BaseException:
+        if is_sqlite:
+            if con.in_transaction:
+                cur.execute("ROLLBACK")
+        else:
+            con.rollback()
+        raise
+    finally:
+        con.close()
+    _mark_delta_applied(delta_dir)
+    return n
+
+def run_apply_delta(argv):
+    p = argparse.ArgumentParser(prog="build_cafe_db_enriched_v5.py apply-delta",
+                                description="--delta_dir 에 쌓인(아직 적용 안 된) 증분을 DB 에 적용하고 스냅샷을 전진")
+    p.add_argument("--delta_dir", required=True)
+    p.add_argument("--sink", default=None, help="mysql | sqlite:경로")
+    p.add_argument("--db_env", default=None, help="DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME 이 든 .env 파일")
+    p.add_argument("--mark_applied", action="store_true",
+                   help="delta.sql 을 직접(mysql 클라이언트 등) 실행한 경우: 실행 없이 적용 완료로 표시")
+    a = p.parse_args(argv)
+    if a.mark_applied:
+        if not os.path.exists(os.path.join(a.delta_dir, DELTA_PENDING)):
+            raise SystemExit(f"[ERROR] 적용 대기 중인 증분이 없습니다: {a.delta_dir}")
+        _mark_delta_applied(a.delta_dir)
+        print(f"[OK] 적용 완료로 표시: {a.delta_dir}")
+        return
+    if not a.sink:
+        p.error("--sink 또는 --mark_applied 가 필요합니다")
+    n = apply_db_delta(a.delta_dir, a.sink, a.db_env)
+    print(f"[OK] 증분 적용({a.sink}): {n}건")
+
+# =========================
+# (추가) 정적 서빙용 카페/지역 JSON 문서(gzip/brotli 미리 압축 + ETag)
+# =========================
+# - cafes/<카페id>.json : 마스터 행 + 가격 항목/요약 + 토큰 빈도 + fact 를 합친 상세 문서
+# - regions/<구>.json   : 지역별 목록 카드, regions.json: 지역 목록
+# - 각 문서는 .json.gz(항상) / .json.br(brotli 설치 시) 변형을 같이 두고,
+#   manifest.json 에 원문 sha256(ETag 용)·크기·변형을 기록합니다.
+# - 재빌드 시 manifest 의 해시/변형이 같고 파일이 남아 있으면 다시 쓰지 않고, 사라진 문서는 지웁니다.
+# - 압축(zlib/brotli)은 GIL 을 놓으므로 스레드로 병렬 처리하고, 동시에 들고 있는 문서 수는 제한합니다.
+DOCS_MANIFEST = "manifest.json"
+DOCS_REGION_LIST = "regions.json"
+DOCS_CARD_COLS = ["cafe_id", "cafe_name", "address", "district", "lat", "lng", "image_url", "main_menus",
+                  "parking", "blog_count", "reco_score", "reco_type", "reco_tags", "price_summary"]
+
+def _json_value(v):
+    if v is None:
+        return None
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, (float, np.floating)):
+        return None if math.isnan(v) else float(v)
+    if isinstance(v, str):
+        return v if v.strip() else None
+    return v
+
+def _doc_variants():
+    return ["gz", "br"] if brotli is not None else ["gz"]
+
+def _doc_region_path(district) -> str:
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", district or "").strip("_") or "기타"
+    return f"regions/{name}.json"
+
+def _write_doc(docs_dir, rel, doc, old):
+    """문서 1개 직렬화 → 해시 비교 → (바뀌었으면) 원문/gz/br 원자적 쓰기. 반환: (rel, manifest 항목, 썼는지)"""
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.sha256(data).hexdigest()[:32]
+    variants = _doc_variants()
+    entry = {"etag": etag, "bytes": len(data), "variants": variants}
+    path = os.path.join(docs_dir, rel)
+    if (old and old.get("etag") == etag and old.get("variants") == variants
+            and all(os.path.exists(p) for p in [path] + [f"{path}.{v}" for v in variants])):
+        return rel, old, False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    blobs = {"": data, ".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        blobs[".br"] = brotli.compress(data, quality=11)
+    for ext, blob in blobs.items():
+        with atomic_output(path + ext) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+        if ext:
+            entry[ext[1:] + "_bytes"] = len(blob)
+    # brotli 가 빠진 환경에서 다시 만들면 예전 .br 은 내용이 달라지므로 지움
+    if brotli is None and os.path.exists(path + ".br"):
+        os.remove(path + ".br")
+    return rel, entry, True
+
+def _read_freq_by_cafe(freq_csv):
+    """토큰 빈도 CSV(cafe_id,name,token,count) → (cafe_id → [{token,count}] (CSV 행 순서), 전체 행 수)
+
+    CSV 는 이름 → 빈도 순 정렬이라 같은 이름의 카페 행이 섞여 있고 마스터 순서와도 다르므로,
+    순서에 기대지 않고 cafe_id 로 모읍니다(카페당 TOP40 이하라 가격/사실 목록과 같은 규모).
+    """
+    groups, n = defaultdict(list), 0
+    with open(freq_csv, encoding="utf-8-sig", newline="") as f:
+        rd = csv.reader(f)
+        next(rd, None)
+        for rec in rd:
+            groups[rec[0]].append({"token": rec[2], "count": int(rec[3])})
+            n += 1
+    return groups, n
+
+def build_cafe_documents(docs_dir, db_df, price_items_df, price_summary_df, fact_rows, freq_csv, workers=None):
+    """카페/지역 JSON 문서 생성(바뀐 문서만 다시 씀). 반환: (전체 문서 수, 새로 쓴 수, 지운 수)"""
+    os.makedirs(docs_dir, exist_ok=True)
+    manifest_path = os.path.join(docs_dir, DOCS_MANIFEST)
+    old_docs = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            old_docs = json.load(f).get("docs", {})
+
+    prices = defaultdict(list)
+    if not price_items_df.empty:
+        for rec in price_items_df.to_dict("records"):
+            prices[rec["카페id"]].append({PRICE_ITEM_SQL_COL[k]: _json_value(v) for k, v in rec.items()
+                                         if k not in ("카페id", "카페이름")})
+    price_stats = {r["카페id"]: {"kinds": _json_value(r["가격종류수"]), "min": _json_value(r["최소가"]),
+                                 "max": _json_value(r["최대가"]), "median": _json_value(r["대표가(중앙값)"])}
+                   for r in price_summary_df.to_dict("records")}
+    facts = defaultdict(list)
+    for f in fact_rows:
+        facts[f["카페id"]].append({"kind": f["kind"], "value": f["value"], "sentence": f["sentence"]})
+
+    master = sql_master_frame(db_df)
+    master = master.astype(object).where(pd.notnull(master), None)
+    cols = list(master.columns)
+
+    tokens, n_freq_rows = _read_freq_by_cafe(freq_csv)
+    n_doc_tokens = 0
+
+    def cafe_docs():
+        nonlocal n_doc_tokens
+        for vals in master.itertuples(index=False, name=None):
+            row = {c: _json_value(v) for c, v in zip(cols, vals)}
+            cid = row["cafe_id"]
+            doc = {}
+            for c, v in row.items():
+                if c.endswith("_json"):
+                    doc[c[:-len("_json")]] = json.loads(v) if v else []
+                else:
+                    doc[c] = v
+            doc["price_stats"] = price_stats.get(cid)
+            doc["prices"] = prices.pop(cid, [])
+            doc["tokens"] = tokens.pop(cid, [])
+            n_doc_tokens += len(doc["tokens"])
+            doc["facts"] = facts.pop(cid, [])
+            cards[row["district"] or ""].append(dict({c: row[c] for c in DOCS_CARD_COLS}, doc=f"cafes/{cid}.json"))
+            yield f"cafes/{cid}.json", doc
+
+    def region_docs():
+        regions = []
+        for district in sorted(cards):
+            items = sorted(cards[district], key=lambda c: -(c["reco_score"] or 0.0))
+            rel = _doc_region_path(district)
+            regions.append({"district": district or None, "count": len(items), "doc": rel})
+            yield rel, {"district": district or None, "count": len(items), "cafes": items}
+        yield DOCS_REGION_LIST, {"regions": regions}
+
+    cards = defaultdict(list)
+    new_docs, n_written = {}, 0
+    workers = workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        inflight = deque()
+        def drain(limit):
+            nonlocal n_written
+            while len(inflight) > limit:
+                rel, entry, written = inflight.popleft().result()
+                new_docs[rel] = entry
+                n_written += written
+        # 지역 문서는 모든 카페 카드가 모인 뒤에 만들어지도록 카페 문서 다음에 이어 붙임
+        for rel, doc in itertools.chain(cafe_docs(), region_docs()):
+            fut = ex.submit(_write_doc, docs_dir, rel, doc, old_docs.get(rel))
+            inflight.append(fut)
+            drain(workers * 4)
+        drain(0)
+
+    # 검증: 토큰 빈도 CSV 의 모든 행이 자기 카페 문서에 정확히 한 번씩 들어갔는지
+    if tokens or n_doc_tokens != n_freq_rows:
+        raise SystemExit(f"[ERROR] 카페 문서 토큰이 빈도 CSV 와 다릅니다: 문서 {n_doc_tokens}행 / CSV {n_freq_rows}행, "
+                         f"마스터에 없는 카페 {len(tokens)}곳 (manifest 는 갱신하지 않음)")
+
+    n_removed = 0
+    for rel in old_docs.keys() - new_docs.keys():
+        path = os.path.join(docs_dir, rel)
+        for p in [path, path + ".gz", path + ".br"]:
+            if os.path.exists(p):
+                os.remove(p)
+        n_removed += 1
+
+    with atomic_output(manifest_path) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "docs": dict(sorted(new_docs.items()))}, f, ensure_ascii=False, indent=1)
+    return len(new_docs), n_written, n_removed
 
 # =========================
 # 6) 카카오 좌표로 보충(이름+주소 기반 매칭)
@@ -776,19 +2208,652 @@ def find_kakao_match(name, address, district, kakao_map):
             best = r
     return best
 
+# =========================
+# (추가) 지역 간 카페 식별(정규 cafe_id) + 중복 제거
+# =========================
+# - 같은 카페가 여러 구 폴더에 중복 수집될 수 있습니다(카카오 CSV의 found_in_gus 참고).
+# - NLP 작업 전에 네이버 place id / 카카오 id / 정규화 상호 / 주소 4글자 조각 / 좌표 거리로
+#   같은 카페를 하나로 묶고, 묶음마다 안정적인 cafe_id 하나를 부여합니다.
+#   (우선순위: 네이버 place id > kakao_<카카오 id> > md5(상호+좌표/주소))
+IDENTITY_MAX_DIST_M = 100      # 같은 상호일 때 같은 카페로 볼 최대 좌표 거리
+IDENTITY_MIN_ADDR_SIM = 0.5    # 같은 상호일 때 같은 카페로 볼 최소 주소 유사도(4글자 조각 Jaccard)
+
+def _name_core(name: str) -> str:
+    """지점 표기를 뗀 상호 정규화 키: '설빙 광주충장로점' -> '설빙'"""
+    if not isinstance(name, str):
+        return ""
+    return norm(re.sub(r"\s+\S*점$", "", name.strip()))
+
+def _addr_shingles(addr_norm: str):
+    if len(addr_norm) < 4:
+        return {addr_norm} if addr_norm else set()
+    return {addr_norm[i:i+4] for i in range(0, len(addr_norm)-3)}
+
+def _to_float(v):
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if f != f else f
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+def _same_place_rule(a: dict, b: dict):
+    """같은 상호 블록 안의 두 레코드가 같은 카페인지(근거 규칙명 or None)"""
+    if a["lat"] is not None and b["lat"] is not None:
+        if _haversine_m(a["lat"], a["lng"], b["lat"], b["lng"]) <= IDENTITY_MAX_DIST_M:
+            return "name+coord"
+    a1, a2 = a["addr_norm"], b["addr_norm"]
+    if a1 and a2:
+        if a1 in a2 or a2 in a1:
+            return "name+addr"
+        s1, s2 = _addr_shingles(a1), _addr_shingles(a2)
+        if s1 and s2 and len(s1 & s2) / len(s1 | s2) >= IDENTITY_MIN_ADDR_SIM:
+            return "name+addr"
+    return None
+
+class _IdentityUnion:
+    """union-find. 서로 다른 네이버 id / 카카오 id 를 가진 묶음은 합치지 않습니다."""
+    def __init__(self, recs):
+        self.parent = list(range(len(recs)))
+        self.rule = [""] * len(recs)
+        self.naver = [{r["naver_id"]} - {""} for r in recs]
+        self.kakao = [{r["kakao_id"]} - {""} for r in recs]
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j, rule):
+        ri, rj = self.find(i), self.find(j)
+        if ri == rj:
+            return False
+        if (self.naver[ri] and self.naver[rj] and self.naver[ri] != self.naver[rj]) or \
+           (self.kakao[ri] and self.kakao[rj] and self.kakao[ri] != self.kakao[rj]):
+            return False
+        lo, hi = min(ri, rj), max(ri, rj)   # 먼저 나온 레코드를 대표로
+        self.parent[hi] = lo
+        self.naver[lo] |= self.naver[hi]
+        self.kakao[lo] |= self.kakao[hi]
+        for k in (i, j):
+            if not self.rule[k]:
+                self.rule[k] = rule
+        return True
+
+def resolve_cafe_identity(place_df: pd.DataFrame, kakao_df: pd.DataFrame):
+    """place_df(여러 지역 합본)의 중복 카페를 하나로 합치고 정규 cafe_id를 부여합니다.
+
+    반환: (중복 제거된 place_df, 원본 행 -> cafe_id 매핑 DataFrame, cafe_id -> 상호 정규화 키 목록)
+    - place_df 에는 lat/lng/district 가 미리 계산되어 있어야 합니다.
+    """
+    recs = []
+    for i, r in enumerate(place_df.to_dict("records")):
+        recs.append({
+            "source": "naver_place", "src_file": r.get("_src_file", ""), "src_row": r.get("_src_row", i),
+            "name": r.get("name", ""), "address": r.get("address", ""),
+            "naver_id": extract_place_id(r.get("place_url", ""), r.get("naver_place_html", "")),
+            "kakao_id": "",
+            "lat": _to_float(r.get("lat")), "lng": _to_float(r.get("lng")),
+        })
+    n_place = len(recs)
+    for i, r in enumerate(kakao_df.to_dict("records")):
+        kid = safe_str(r.get("id")) or ""
+        recs.append({
+            "source": "kakao", "src_file": r.get("_src_file", ""), "src_row": r.get("_src_row", i),
+            "name": r.get("name", ""), "address": r.get("address", ""),
+            "naver_id": "", "kakao_id": kid[:-2] if kid.endswith(".0") else kid,
+            "lat": _to_float(r.get("y")), "lng": _to_float(r.get("x")),
+        })
+    for rec in recs:
+        rec["name_norm"] = norm(rec["name"])
+        rec["name_core"] = _name_core(rec["name"])
+        rec["addr_norm"] = norm(rec["address"])
+        if rec["lat"] is None or rec["lng"] is None:
+            rec["lat"] = rec["lng"] = None
+
+    uf = _IdentityUnion(recs)
+
+    # 1) 외부 id 가 같으면 같은 카페
+    for key, rule in (("naver_id", "naver_id"), ("kakao_id", "kakao_id")):
+        first = {}
+        for i, rec in enumerate(recs):
+            v = rec[key]
+            if not v:
+                continue
+            if v in first:
+                uf.union(first[v], i, rule)
+            else:
+                first[v] = i
+
+    # 2) 상호(지점 표기 제외) 블록 안에서 주소/좌표가 맞으면 같은 카페
+    blocks = defaultdict(list)
+    for i, rec in enumerate(recs):
+        if rec["name_core"]:
+            blocks[rec["name_core"]].append(i)
+    for idx in blocks.values():
+        for a in range(len(idx)):
+            for b in range(a + 1, len(idx)):
+                i, j = idx[a], idx[b]
+                if recs[i]["source"] == "kakao" and recs[j]["source"] == "kakao":
+                    continue  # 카카오 id 가 다르면 다른 장소
+                rule = _same_place_rule(recs[i], recs[j])
+                if rule:
+                    uf.union(i, j, rule)
+
+    # 3) 묶음별 정규 cafe_id
+    canon = {}
+    for i, rec in enumerate(recs):
+        root = uf.find(i)
+        if root in canon:
+            continue
+        if uf.naver[root]:
+            canon[root] = min(uf.naver[root])
+        elif uf.kakao[root]:
+            canon[root] = "kakao_" + min(uf.kakao[root])
+        else:
+            base = recs[root]
+            loc = f"{base['lat']:.3f},{base['lng']:.3f}" if base["lat"] is not None else base["addr_norm"]
+            canon[root] = hashlib.md5(f"{base['name_norm']}_{loc}".encode("utf-8")).hexdigest()[:12]
+
+    map_rows = []
+    for i, rec in enumerate(recs):
+        map_rows.append({
+            "source": rec["source"],
+            "source_file": rec["src_file"],
+            "source_row": rec["src_row"],
+            "source_name": rec["name"],
+            "source_address": rec["address"],
+            "naver_place_id": rec["naver_id"],
+            "kakao_id": rec["kakao_id"],
+            "cafe_id": canon[uf.find(i)],
+            "match_rule": uf.rule[i] or "single",
+        })
+    identity_df = pd.DataFrame(map_rows)
+
+    # 4) place 행 중복 제거(먼저 나온 행 기준, 비어있는 좌표/이미지/링크는 같은 묶음의 다른 행으로 보충)
+    out = place_df.copy()
+    out["cafe_id"] = identity_df["cafe_id"].iloc[:n_place].to_numpy()
+    aliases = defaultdict(list)
+    for cid, nn in zip(out["cafe_id"], norm_series(out["name"].astype(str))):
+        if nn not in aliases[cid]:
+            aliases[cid].append(nn)
+    for col in ["lat", "lng", "place_image_url", "place_url"]:
+        if col in out.columns:
+            filled = out[col].where(out[col].map(lambda v: safe_str(v) is not None))
+            out[col] = filled.groupby(out["cafe_id"]).transform("first").fillna(out[col])
+    out = out.drop_duplicates("cafe_id", keep="first").reset_index(drop=True)
+    return out, identity_df, aliases
+
+def read_inputs(paths) -> pd.DataFrame:
+    """CSV 1개 이상을 읽어 합칩니다(원본 파일/행 번호를 _src_file/_src_row로 보존)."""
+    if isinstance(paths, str):
+        paths = [paths]
+    dfs = []
+    for path in paths:
+        df = pd.read_csv(path)
+        df["_src_file"] = path
+        df["_src_row"] = range(len(df))
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+
+# =========================
+# (추가) 카페 토큰 프로필(재채점용 중간 산출물)
+# =========================
+# - 사전(ATMOSPHERE/TASTE/COMPANION/MENU)이나 calc_score 가중치만 바꾸는 재실행에서
+#   Kiwi 토큰화를 건너뛰기 위해, 카페별 Kiwi 결과를 JSONL로 저장합니다.
+# - text_hash: 상호/구/주소/블로그 본문 해시(입력이 바뀌면 프로필은 오래된 것으로 간주)
+# - tok_fp   : 토큰화 규칙(불용어/정규화/Kiwi 버전 등) 지문(규칙이 바뀌면 오래된 것으로 간주)
+def profile_fingerprint() -> str:
+    spec = {
+        "kiwi": KIWI_VERSION,
+        "base_sw": sorted(BASE_STOPWORDS),
+        "domain_sw": sorted(DOMAIN_STOPWORDS),
+        "normalize": sorted(NORMALIZE_TOKEN_MAP.items()),
+        "single": sorted(ALLOWED_SINGLE),
+        "suffixes": _NAME_SUFFIXES,
+        "park": [PARK_POS, PARK_NEG],
+        "facility": sorted(_FACILITY_LABEL.items()),
+        "engine": "sentence_v1",
+        "price": [_PRICE_STRICT.pattern, _PRICE_LOOSE.pattern],
+    }
+    if kiwi_fingerprint_spec() is not None:
+        spec["analyzer"] = kiwi_fingerprint_spec()
+    return hashlib.md5(json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+def cafe_text_hash(name, district, addr, text) -> str:
+    raw = "\x1f".join([name or "", district or "", addr or "", text or ""])
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+def build_cafe_profile(cafe_id, name, district, addr, posts, text_hash, tok_fp, segments=None, weak=None,
+                       post_counts=None):
+    """카페 1곳의 Kiwi/정규식 작업 결과(사전·가중치와 무관한 부분 + 메뉴 fact)
+
+    - 블로그 글(posts)을 문장 추출 엔진으로 한 번만 훑습니다.
+    - 메뉴 fact 는 MENU_KEYWORDS 에 의존하므로 menu_fp 를 함께 저장합니다.
+    """
+    base_cnt, facts = extract_post_facts(posts, segments, weak, post_counts)
+    return {
+        "cafe_id": cafe_id,
+        "text_hash": text_hash,
+        "tok_fp": tok_fp,
+        "base_counts": dict(base_cnt),
+        "row_sw": sorted(row_stopword_candidates(name, district, addr)),
+        "parking": parking_from_facts(facts),
+        # strict 후보 먼저(중복 제거 시 strict 우선 - 예전 전체 본문 스캔과 같은 순서)
+        "price_cands": sorted((f for f in facts if f["kind"] == "price"), key=lambda f: f["source"] != "strict"),
+        "facts": [f for f in facts if f["kind"] != "price"],
+        "menu_fp": menu_lexicon_fp(),
+    }
+
+def save_profiles(path: str, records):
+    with atomic_output(path) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+class ProfileIndex:
+    """프로필 JSONL(들)의 text_hash → (파일, 위치, tok_fp) 색인
+
+    - 본문(base_counts/facts/문장)은 get() 할 때 그 줄만 다시 읽으므로 메모리는 카페 수에만 비례합니다.
+    - 같은 해시가 여러 번 있으면 뒤 파일/뒤 줄이 우선합니다(체크포인트가 프로필보다 최신).
+    """
+    def __init__(self, paths=()):
+        self.files = []
+        self.loc = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            f = open(path, "rb")
+            fi = len(self.files)
+            self.files.append(f)
+            pos = 0
+            for line in iter(f.readline, b""):
+                try:
+                    rec = json.loads(line)
+                    self.loc[rec["text_hash"]] = (fi, pos, rec.get("tok_fp"))
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    pass  # 빈 줄 / 비정상 종료로 잘린 마지막 줄(체크포인트)
+                pos += len(line)
+
+    def __contains__(self, text_hash):
+        return text_hash in self.loc
+
+    def fp(self, text_hash):
+        return self.loc[text_hash][2]
+
+    def get(self, text_hash):
+        if text_hash not in self.loc:
+            return None
+        fi, pos, _ = self.loc[text_hash]
+        f = self.files[fi]
+        f.seek(pos)
+        return json.loads(f.readline())
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+class ProfileWriter:
+    """최종 프로필 JSONL 을 카페 순서대로 바로 흘려 씁니다(임시 파일 → commit 에서 os.replace)."""
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                f".{os.path.basename(path)}.{os.getpid()}.tmp")
+        self.f = open(self.tmp, "w", encoding="utf-8")
+        self.n = 0
+
+    def add(self, rec: dict):
+        self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.n += 1
+
+    def commit(self):
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+def check_profiles_fresh(keys, profiles: ProfileIndex, tok_fp: str):
+    """재채점 전 검사: 모든 카페의 프로필이 현재 입력/규칙과 일치하는지 확인합니다."""
+    keys = list(keys)
+    missing = [cid for cid, h in keys if h not in profiles]
+    old_fp = [cid for cid, h in keys if h in profiles and profiles.fp(h) != tok_fp]
+    problems = []
+    if missing:
+        problems.append(f"입력이 바뀐 카페 {len(missing)}곳(예: {', '.join(map(str, missing[:5]))})")
+    if old_fp:
+        problems.append(f"토큰화 규칙이 바뀐 카페 {len(old_fp)}곳(예: {', '.join(map(str, old_fp[:5]))})")
+    return problems
+
+# =========================
+# (추가) 월별 키워드 추이(postdate 기준, 증분 누적)
+# =========================
+# - 카페 × 월 × 토큰 빈도를 월 단위 파티션(trend_dir/YYYY-MM.csv)에 희소 형태로 저장합니다.
+# - 이미 저장된 (월, 카페)는 다시 토큰화하지 않습니다. 단, 저장된 가장 최근 월은
+#   수집이 덜 끝났을 수 있으므로 이번 입력에 있는 카페만큼 다시 계산합니다.
+# - 저장값은 사전과 무관한 기본 토큰 빈도(글마다 add_base_tokens 합)라서 사전을 바꿔도 다시 쌓을 필요가 없습니다.
+#   이번 실행에서 프로필을 만든 카페는 문장 추출 엔진의 글별 빈도를 그대로 쓰고(Kiwi 1회),
+#   재사용한 프로필의 카페만 필요한 글을 다시 토큰화합니다.
+TREND_WINDOW_MONTHS = 3     # 최근/이전 구간 길이(개월)
+TREND_TOPK = 20             # 카페별 최근 키워드 개수
+TREND_SURGE_RATIO = 2.0     # 이전 구간 대비 이 배수 이상이면 급상승
+TREND_SURGE_MIN = 5         # 급상승 판정 최소 언급 수(최근 구간)
+
+def postdate_month(v) -> str:
+    """20250619 / '2025-06-19' -> '2025-06' (알 수 없으면 '')"""
+    digits = re.sub(r"\D", "", str(v))
+    if len(digits) < 6 or digits[:2] not in ("19", "20"):
+        return ""
+    mm = digits[4:6]
+    return f"{digits[:4]}-{mm}" if "01" <= mm <= "12" else ""
+
+def _trend_partition_path(trend_dir: str, month: str) -> str:
+    return os.path.join(trend_dir, f"{month}.csv")
+
+def _month_range(first: str, last: str):
+    """'2025-01'~'2025-04' 사이의 모든 달(글이 없는 달도 포함)"""
+    return [str(p) for p in pd.period_range(first, last, freq="M")]
+
+def trend_months(trend_dir: str):
+    if not trend_dir or not os.path.isdir(trend_dir):
+        return []
+    return sorted(f[:-4] for f in os.listdir(trend_dir) if re.fullmatch(r"\d{4}-\d{2}\.csv", f))
+
+def read_trend_partition(trend_dir: str, month: str, tokens=None) -> pd.DataFrame:
+    """tokens: 남길 토큰 집합 또는 판정 함수(token -> bool)"""
+    path = _trend_partition_path(trend_dir, month)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["cafe_id", "token", "count"])
+    df = pd.read_csv(path, dtype={"cafe_id": str, "token": str}, keep_default_na=False)
+    if callable(tokens):
+        df = df[df["token"].map(tokens).astype(bool)]
+    elif tokens is not None:
+        df = df[df["token"].isin(tokens)]
+    return df
+
+class TrendWriter:
+    """이번 실행에서 새로 계산할 (월, 카페) 기본 토큰 빈도를 월별 임시 파일에 흘려 쓰고, finish()에서 파티션에 합칩니다."""
+    def __init__(self, trend_dir: str):
+        os.makedirs(trend_dir, exist_ok=True)
+        self.trend_dir = trend_dir
+        stored = trend_months(trend_dir)
+        self.latest = stored[-1] if stored else ""
+        self.stage_dir = tempfile.mkdtemp(prefix=".trend_stage_", dir=trend_dir)
+        self.have = {}      # 월 -> 이미 저장된 cafe_id (필요한 달만 읽음)
+        self.files = {}     # 월 -> (파일, csv.writer)
+        self.cafes = defaultdict(set)
+
+    def needs(self, cafe_id, month: str) -> bool:
+        if month not in self.have:
+            self.have[month] = (set(read_trend_partition(self.trend_dir, month)["cafe_id"])
+                                if month < self.latest else set())
+        return str(cafe_id) not in self.have[month]
+
+    def add(self, cafe_id, month: str, cnt: Counter):
+        if month not in self.files:
+            f = open(os.path.join(self.stage_dir, f"{month}.csv"), "w", encoding="utf-8", newline="")
+            self.files[month] = (f, csv.writer(f, lineterminator="\n"))
+        self.files[month][1].writerows((cafe_id, t, c) for t, c in cnt.items())
+        self.cafes[month].add(str(cafe_id))
+
+    def finish(self) -> int:
+        """임시 파일 → 월 파티션(다시 계산한 카페의 예전 행은 교체). 반환: 새로 계산한 (월, 카페) 수"""
+        try:
+            for month in sorted(self.files):
+                f, _ = self.files[month]
+                f.close()
+                new = pd.read_csv(f.name, names=["cafe_id", "token", "count"],
+                                  dtype={"cafe_id": str, "token": str}, keep_default_na=False)
+                old = read_trend_partition(self.trend_dir, month)
+                merged = pd.concat([old[~old["cafe_id"].isin(self.cafes[month])], new], ignore_index=True)
+                to_csv_atomic(merged, _trend_partition_path(self.trend_dir, month), index=False, encoding="utf-8")
+        finally:
+            for f, _ in self.files.values():
+                f.close()
+            shutil.rmtree(self.stage_dir, ignore_errors=True)
+        return sum(len(c) for c in self.cafes.values())
+
+def add_cafe_trends(trend: TrendWriter, cafe_id, posts, dates, post_counts=None, weak=None):
+    """카페 1곳의 글을 월별로 묶어 아직 없는 (월, 카페)만 기록. post_counts 가 없으면 필요한 글만 토큰화
+
+    weak[i] 가 참인 글(협찬)은 프로필 집계(extract_post_facts)와 같이 토큰마다 1회만 셉니다.
+    """
+    months = [postdate_month(d) for d in dates]
+    by_month = defaultdict(Counter)
+    for i, (post, month) in enumerate(zip(posts, months)):
+        if not month or not trend.needs(cafe_id, month):
+            continue
+        post_cnt = post_counts[i] if post_counts is not None else kiwi_base_counts(post)
+        by_month[month].update(dict.fromkeys(post_cnt, 1) if weak and weak[i] else post_cnt)
+    for month in sorted(by_month):
+        trend.add(cafe_id, month, by_month[month])
+
+def build_recent_keywords(trend_dir: str, cafe_meta, window: int = TREND_WINDOW_MONTHS, topk: int = TREND_TOPK):
+    """최근 window개월 파티션만 읽어 카페별 최근 키워드 TOP(k)를 만듭니다.
+
+    cafe_meta: [(cafe_id, 카페이름, row_sw 후보)] — 이번 실행에 포함된 카페만 대상
+    """
+    stored = trend_months(trend_dir)
+    cols = ["카페id", "카페이름", "기간", "최근키워드TOP20"]
+    if not stored:
+        return pd.DataFrame(columns=cols)
+    months = _month_range(stored[0], stored[-1])[-window:]
+    ids = {str(cid) for cid, _, _ in cafe_meta}
+    base = defaultdict(Counter)
+    for month in months:
+        df = read_trend_partition(trend_dir, month)
+        df = df[df["cafe_id"].isin(ids)]
+        for cid, tok, c in zip(df["cafe_id"], df["token"], df["count"]):
+            base[cid][tok] += int(c)
+
+    rows = []
+    for cid, name, row_sw in cafe_meta:
+        cnt = base.get(str(cid))
+        if not cnt:
+            continue
+        top = derive_profile_counts(cnt, finalize_row_stopwords(row_sw), profile="top40")
+        rows.append({
+            "카페id": cid,
+            "카페이름": name,
+            "기간": f"{months[0]}~{months[-1]}",
+            "최근키워드TOP20": json.dumps([k for k, _ in top.most_common(topk)], ensure_ascii=False),
+        })
+    return pd.DataFrame(rows, columns=cols)
+
+def build_menu_trend(trend_dir: str, window: int = TREND_WINDOW_MONTHS):
+    """메뉴 키워드의 월별 언급 수 → 최근/이전 window개월 합계(rolling)와 급상승 여부
+
+    - 최근 2×window 개월 파티션만, 메뉴 토큰 행만 읽습니다(이력이 길어져도 비용 일정).
+    """
+    stored = trend_months(trend_dir)
+    cols = ["메뉴", "최근구간", "최근언급수", "이전언급수", "증가배수", "급상승", "월별언급수"]
+    if not stored:
+        return pd.DataFrame(columns=cols)
+    months = _month_range(stored[0], stored[-1])[-2 * window:]
+
+    # 메뉴 토큰은 접미사 확장(망고빙수 -> 망고/망고빙수)을 거쳐야 기존 태깅과 같은 기준이 됩니다.
+    menu_set = set(MENU_KEYWORDS)
+    is_menu_token = lambda tok: any(t in menu_set for t in _expand_name_suffixes(tok))
+    monthly = pd.DataFrame(0, index=months, columns=MENU_KEYWORDS)
+    for month in months:
+        df = read_trend_partition(trend_dir, month, tokens=is_menu_token)
+        cnt = Counter()
+        for tok, c in zip(df["token"], df["count"]):
+            for t in _expand_name_suffixes(tok):
+                if t in menu_set:
+                    cnt[t] += int(c)
+        for m, c in cnt.items():
+            monthly.loc[month, m] = c
+
+    rolling = monthly.rolling(window, min_periods=1).sum()
+    recent = rolling.iloc[-1]
+    prev = rolling.iloc[-1 - window] if len(months) > window else pd.Series(0, index=MENU_KEYWORDS)
+    rows = []
+    for m in MENU_KEYWORDS:
+        r_cnt, p_cnt = int(recent[m]), int(prev[m])
+        if r_cnt == 0 and p_cnt == 0:
+            continue
+        ratio = round(r_cnt / p_cnt, 2) if p_cnt else None
+        surge = r_cnt >= TREND_SURGE_MIN and (p_cnt == 0 or r_cnt / p_cnt >= TREND_SURGE_RATIO)
+        rows.append({
+            "메뉴": m,
+            "최근구간": f"{months[max(0, len(months)-window)]}~{months[-1]}",
+            "최근언급수": r_cnt,
+            "이전언급수": p_cnt,
+            "증가배수": ratio,
+            "급상승": "Y" if surge else "",
+            "월별언급수": json.dumps({mo: int(monthly.loc[mo, m]) for mo in months if monthly.loc[mo, m]}, ensure_ascii=False),
+        })
+    out = pd.DataFrame(rows, columns=cols)
+    return out.sort_values(["급상승", "최근언급수"], ascending=[False, False], kind="stable")
+
+# =========================
+# (추가) 샤드 실행 + 결정적 병합(merge)
+# =========================
+# - --shard i/N: 입력/식별은 전체로 하고, cafe_id 해시(md5) % N == i 인 카페만 처리해서
+#   shard_dir 에 부분 출력을 씁니다.
+#     cafes.jsonl   카페별 {seq, 마스터 행, 가격 항목, fact} (seq = 전체 실행에서의 카페 순번)
+#     freq_runs/    토큰 빈도 run(카페별/전역) - TokenFreqStore 의 spill 형식 그대로
+#     profile.jsonl 프로필(cafes.jsonl 과 같은 순서), identity.csv, shard.json(완료 표시)
+# - merge: 샤드들을 seq 순으로 합치고 빈도 run 을 k-way 병합해서, 한 번에 돌린 결과와
+#   바이트 단위로 같은 최종 출력을 만듭니다.
+SHARD_META = "shard.json"
+SHARD_CAFES = "cafes.jsonl"
+SHARD_FREQ_RUNS = "freq_runs"
+SHARD_PROFILE = "profile.jsonl"
+SHARD_IDENTITY = "identity.csv"
+SHARD_SKETCH = "global_sketch.json"
+SHARD_POST_FILTER = "post_filter.csv"
+
+def shard_of(cafe_id, num_shards: int) -> int:
+    """정규 cafe_id 의 안정 해시(실행/머신과 무관)"""
+    return int(hashlib.md5(str(cafe_id).encode("utf-8")).hexdigest()[:8], 16) % num_shards
+
+def parse_shard(v):
+    m = re.fullmatch(r"(\d+)/(\d+)", str(v).strip())
+    if not m or not (0 <= int(m.group(1)) < int(m.group(2))):
+        raise argparse.ArgumentTypeError(f"샤드 형식이 아닙니다: {v} (예: 0/4)")
+    return int(m.group(1)), int(m.group(2))
+
+def shard_input_fingerprint(cafe_ids, text_hashes, tok_fp) -> str:
+    """샤드들이 같은 입력/규칙으로 돌았는지 merge 에서 확인하기 위한 지문"""
+    h = hashlib.md5(tok_fp.encode("utf-8"))
+    for cid, th in zip(cafe_ids, text_hashes):
+        h.update(f"{cid}\x1f{th}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def write_shard_outputs(shard_dir, shard, records, freq_store, identity_df, post_filter_df, cafes_fp, n_total):
+    freq_store.spill()
+    with atomic_output(os.path.join(shard_dir, SHARD_CAFES)) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    to_csv_atomic(identity_df, os.path.join(shard_dir, SHARD_IDENTITY), index=False, encoding="utf-8-sig")
+    to_csv_atomic(post_filter_df, os.path.join(shard_dir, SHARD_POST_FILTER), index=False, encoding="utf-8-sig")
+    sketch_path = os.path.join(shard_dir, SHARD_SKETCH)
+    if freq_store.sketch is not None:
+        with atomic_output(sketch_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(freq_store.sketch.to_json(), f, ensure_ascii=False)
+    elif os.path.exists(sketch_path):
+        os.remove(sketch_path)
+    # shard.json 은 마지막에 씁니다(이 파일이 있어야 완료된 샤드)
+    meta = {"shard": shard[0], "num_shards": shard[1], "n_cafes": len(records),
+            "n_total": n_total, "input_fp": cafes_fp, "sketch": freq_store.sketch is not None}
+    with atomic_output(os.path.join(shard_dir, SHARD_META)) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+def _iter_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def merge_shards(args):
+    metas = []
+    for d in args.shard_dirs:
+        path = os.path.join(d, SHARD_META)
+        if not os.path.exists(path):
+            raise SystemExit(f"[ERROR] 완료되지 않은 샤드입니다(shard.json 없음): {d}")
+        with open(path, encoding="utf-8") as f:
+            metas.append(json.load(f))
+
+    num_shards = {m["num_shards"] for m in metas}
+    input_fps = {m["input_fp"] for m in metas}
+    if len(num_shards) != 1 or len(input_fps) != 1:
+        raise SystemExit("[ERROR] 샤드들의 N 또는 입력/규칙 지문이 다릅니다(같은 입력으로 다시 실행하세요)")
+    got = sorted(m["shard"] for m in metas)
+    if got != list(range(num_shards.pop())):
+        raise SystemExit(f"[ERROR] 샤드 구성이 맞지 않습니다: {got} (0..N-1 이 한 번씩 필요)")
+
+    # 카페 레코드: 각 샤드 안은 seq 오름차순 → heapq.merge 로 전체 순서 복원
+    rows, price_items, fact_rows = [], [], []
+    for rec in heapq.merge(*(_iter_jsonl(os.path.join(d, SHARD_CAFES)) for d in args.shard_dirs),
+                           key=lambda rec: rec["seq"]):
+        rows.append(rec["row"])
+        price_items.extend(rec["price_items"])
+        fact_rows.extend(rec["facts"])
+    if len(rows) != metas[0]["n_total"]:
+        raise SystemExit(f"[ERROR] 병합된 카페 수({len(rows)})가 전체({metas[0]['n_total']})와 다릅니다")
+
+    freq_store = TokenFreqStore()
+    if any(m.get("sketch") for m in metas):
+        if not all(m.get("sketch") for m in metas):
+            raise SystemExit("[ERROR] 전역 빈도 모드(exact/spacesaving)가 샤드마다 다릅니다")
+        # 근사 요약은 샤드 번호 순으로 합침(결과가 인자 순서와 무관하도록)
+        for m, d in sorted(zip(metas, args.shard_dirs), key=lambda x: x[0]["shard"]):
+            with open(os.path.join(d, SHARD_SKETCH), encoding="utf-8") as f:
+                sk = SpaceSavingCounter.from_json(json.load(f))
+            if freq_store.sketch is None:
+                freq_store.sketch = sk
+            else:
+                freq_store.sketch.merge(sk)
+    for d in args.shard_dirs:
+        run_dir = os.path.join(d, SHARD_FREQ_RUNS)
+        for fn in sorted(os.listdir(run_dir)):
+            (freq_store.freq_runs if fn.startswith("freq_") else freq_store.global_runs).append(os.path.join(run_dir, fn))
+
+    saved = write_outputs(args, rows, price_items, fact_rows, freq_store)
+    # 식별표/글 거르기 집계는 전체 입력 기준이라 샤드마다 같음 → 첫 샤드 것을 그대로
+    for name, out in ((SHARD_IDENTITY, args.out_identity), (SHARD_POST_FILTER, args.out_post_filter)):
+        with atomic_output(out) as tmp:
+            shutil.copyfile(os.path.join(args.shard_dirs[0], name), tmp)
+        saved.append(out)
+    # 프로필도 샤드별(cafes.jsonl 과 같은 순서)로 흘려 읽으며 seq 순으로 병합
+    prof_paths = [os.path.join(d, SHARD_PROFILE) for d in args.shard_dirs]
+    if all(os.path.exists(p) for p in prof_paths):
+        streams = [zip((rec["seq"] for rec in _iter_jsonl(os.path.join(d, SHARD_CAFES))), _iter_jsonl(p))
+                   for d, p in zip(args.shard_dirs, prof_paths)]
+        save_profiles(args.out_profile, (prof for _, prof in heapq.merge(*streams, key=lambda x: x[0])))
+        saved.append(args.out_profile)
+
+    print(f"[OK] merged {len(metas)} shards ({len(rows)} cafes):")
+    for path in saved:
+        print(" -", path)
+
 # =========================
 # 7) 실행
 # =========================
 def main(args):
-    place_df = pd.read_csv(args.place_csv)
-    blog_df  = pd.read_csv(args.blog_csv)
-    kakao_df = pd.read_csv(args.kakao_csv)
+    kiwi_cfg = resolve_kiwi_config(args.kiwi_mode, args.kiwi_model, args.kiwi_typos, args.kiwi_match, args.kiwi_threads)
+    if kiwi_cfg != KIWI_CFG:
+        configure_kiwi(kiwi_cfg)
+        print(f"[INFO] Kiwi 분석기: mode={kiwi_cfg['mode']} model={kiwi_cfg['model'] or kiwi.model_type} "
+              f"typos={kiwi_cfg['typos'] or '-'} match={kiwi_cfg['match']} threads={kiwi.num_workers}")
+
+    place_df = read_inputs(args.place_csv)
+    blog_df  = read_inputs(args.blog_csv)
+    kakao_df = read_inputs(args.kakao_csv)
 
     # 컬럼 방어
     for col in ["name","address","place_url","place_image_url","naver_place_html"]:
         if col not in place_df.columns:
             place_df[col] = ""
-    for col in ["name","content","link"]:
+    for col in ["name","content","link","postdate"]:
         if col not in blog_df.columns:
             blog_df[col] = ""
     for col in ["name","address","x","y","url","gu"]:
@@ -799,45 +2864,138 @@ def main(args):
     place_df["lat"], place_df["lng"] = zip(*place_df["naver_place_html"].map(extract_lat_lng_from_html))
     place_df["district"] = place_df["address"].apply(extract_district)
 
-    # cafe_id
-    place_df["cafe_id"] = place_df.apply(
-        lambda r: extract_place_id(r.get("place_url",""), r.get("naver_place_html","")),
-        axis=1
-    )
-    mask = place_df["cafe_id"].isna() | (place_df["cafe_id"] == "")
-    place_df.loc[mask, "cafe_id"] = place_df[mask].apply(
-        lambda r: hashlib.md5(f"{r.get('name','')}_{r.get('address','')}".encode("utf-8")).hexdigest()[:12],
-        axis=1
-    )
-
-    # 블로그 정리 + 카페별 합치기 (이름 정규화 키도 함께 사용)
-    blog_df["clean_content"] = blog_df["content"].astype(str).map(clean_text)
-    blog_df["name_norm"] = blog_df["name"].astype(str).map(norm)
-
-    blog_group = blog_df.groupby("name_norm").agg(
-        blog_count=("link","count"),
-        combined_text=("clean_content", lambda s: " ".join(s))
-    ).reset_index()
+    # ✅ cafe_id: 지역 간 중복을 합친 정규 id (NLP 작업 전에 확정)
+    place_df, identity_df, name_aliases = resolve_cafe_identity(place_df, kakao_df)
 
-    place_df["name_norm"] = place_df["name"].astype(str).map(norm)
+    # 블로그 정리 + 카페별 합치기 (같은 카페의 모든 상호 표기로 매칭, 같은 글은 한 번만)
+    blog_df["clean_content"] = blog_df["content"].map(clean_text)
+    blog_df["name_norm"] = norm_series(blog_df["name"].astype(str))
 
-    cafes = place_df.merge(blog_group, on="name_norm", how="left")
+    alias_df = pd.DataFrame(
+        [(cid, nn) for cid, nns in name_aliases.items() for nn in nns],
+        columns=["cafe_id", "name_norm"]
+    )
+    blog_pairs = blog_df[["name_norm", "name", "link", "postdate", "clean_content"]].reset_index() \
+        .merge(alias_df, on="name_norm", how="inner") \
+        .sort_values(["cafe_id", "index"], kind="stable")
+    dup = blog_pairs["link"].notna() & blog_pairs.duplicated(["cafe_id", "link"])
+    blog_pairs = blog_pairs[~dup]
+
+    # (추가) Kiwi 전 글 거르기: 광고는 가중치↓, 목록형/스치듯 언급은 제외(블로그수는 전체 글 기준 유지)
+    if args.post_filter == "on":
+        # 상호 키: 같은 카페 묶음의 모든 상호 표기(네이버/카카오) + 글마다 블로그 검색명
+        group_names = identity_df.groupby("cafe_id")["source_name"].agg(list).to_dict()
+        group_keys = {cid: post_name_keys(names) for cid, names in group_names.items()}
+        blog_keys = {n: post_name_keys([n]) for n in blog_pairs["name"].unique()}
+        texts, cids = blog_pairs["clean_content"].tolist(), blog_pairs["cafe_id"].tolist()
+        post_keys = [group_keys.get(cid, set()) | blog_keys[n] for cid, n in zip(cids, blog_pairs["name"])]
+        verdicts = [classify_post(t, k) for t, k in zip(texts, post_keys)]
+        blog_pairs["filter"] = keep_last_post(cids, texts, verdicts, post_keys)
+    else:
+        blog_pairs["filter"] = ""
+    filter_counts = blog_pairs.groupby(["cafe_id", "filter"]).size().unstack(fill_value=0)
+    kept_posts = blog_pairs[~blog_pairs["filter"].isin(POST_FILTER_DROP)]
+    n_drop = len(blog_pairs) - len(kept_posts)
+    n_weak = int((kept_posts["filter"] == "sponsored").sum())
+    print(f"[INFO] 글 거르기: 전체 {len(blog_pairs)}개 중 제외 {n_drop}개, 광고 가중치↓ {n_weak}개")
+
+    blog_group = blog_pairs.groupby("cafe_id").agg(blog_count=("link","count")).reset_index().merge(
+        kept_posts.groupby("cafe_id").agg(
+            combined_text=("clean_content", lambda s: " ".join(s)),
+            posts=("clean_content", list),
+            post_links=("link", list),
+            post_dates=("postdate", list),
+            post_weak=("filter", lambda s: [f == "sponsored" for f in s]),
+        ).reset_index(), on="cafe_id", how="left")
+
+    place_df["name_norm"] = norm_series(place_df["name"].astype(str))
+
+    cafes = place_df.merge(blog_group, on="cafe_id", how="left")
     cafes["blog_count"] = cafes["blog_count"].fillna(0).astype(int)
     cafes["combined_text"] = cafes["combined_text"].fillna("")
 
     # 카카오 맵(이름 정규화 기반)
-    kakao_df["name_norm"] = kakao_df["name"].astype(str).map(norm)
-    kakao_df["addr_norm"] = kakao_df["address"].astype(str).map(norm)
+    kakao_df["name_norm"] = norm_series(kakao_df["name"].astype(str))
+    kakao_df["addr_norm"] = norm_series(kakao_df["address"].astype(str))
 
     kakao_map = defaultdict(list)
     for _, r in kakao_df.iterrows():
         kakao_map[r["name_norm"]].append(r.to_dict())
 
+    # (추가) 카페별 입력 해시 + 재채점 모드면 저장된 프로필 로드/검사
+    tok_fp = profile_fingerprint()
+    menu_fp = menu_lexicon_fp()
+    # 광고 글 가중치(weak)도 토큰 빈도를 바꾸므로 해시에 포함
+    hash_text = [
+        t + "\x1d" + "".join("1" if x else "0" for x in w) if isinstance(w, list) and any(w) else t
+        for t, w in zip(cafes["combined_text"], cafes["post_weak"])
+    ]
+    cafes["text_hash"] = [
+        cafe_text_hash(safe_str(n), safe_str(d), safe_str(a), safe_str(t) or "")
+        for n, d, a, t in zip(cafes["name"], cafes["district"], cafes["address"], hash_text)
+    ]
+    post_filter_df = pd.DataFrame({
+        "카페id": cafes["cafe_id"], "카페이름": cafes["name"], "글수": cafes["blog_count"],
+        "유지": [len(p) if isinstance(p, list) else 0 for p in cafes["posts"]],
+        **{label: cafes["cafe_id"].map(filter_counts[key]).fillna(0).astype(int) if key in filter_counts
+           else 0 for key, label in POST_FILTER_LABELS.items()},
+    })
+
+    # (추가) 샤드 실행: 전체 카페 순번(_seq)을 매긴 뒤 cafe_id 해시로 내 몫만 남김
+    cafes["_seq"] = np.arange(len(cafes))
+    if args.shard:
+        shard_i, shard_n = args.shard
+        cafes_fp = shard_input_fingerprint(cafes["cafe_id"], cafes["text_hash"], tok_fp)
+        n_total = len(cafes)
+        cafes = cafes[cafes["cafe_id"].map(lambda c: shard_of(c, shard_n)) == shard_i]
+        print(f"[INFO] 샤드 {shard_i}/{shard_n}: 전체 {n_total}곳 중 {len(cafes)}곳 처리")
+
+    # 프로필은 메모리에 모아 두지 않음: 읽기는 위치 색인(ProfileIndex), 쓰기는 카페마다 바로(ProfileWriter)
+    profiles = ProfileIndex()
+    if args.rescore:
+        if not os.path.exists(args.out_profile):
+            raise SystemExit(f"[ERROR] --rescore: 프로필 파일이 없습니다: {args.out_profile} (--rescore 없이 한 번 실행하세요)")
+        profiles = ProfileIndex([args.out_profile])
+        problems = check_profiles_fresh(zip(cafes["cafe_id"], cafes["text_hash"]), profiles, tok_fp)
+        if problems:
+            raise SystemExit("[ERROR] --rescore: 프로필이 오래되었습니다 → " + "; ".join(problems)
+                             + " (--rescore 없이 전체 실행으로 다시 생성하세요)")
+    n_profiles = 0
+    cafe_meta = []  # 월별 추이용 (cafe_id, 카페이름, row_sw 후보)
+
+    # (추가) 체크포인트: 끝난 카페 프로필을 바로바로 덧붙이고, --resume 이면 이미 끝난 카페는 건너뜀
+    ckpt_path = args.out_profile + ".ckpt"
+    cached = ProfileIndex()
+    ckpt = None
+    prof_out = None
+    if not args.rescore:
+        if args.resume:
+            cached = ProfileIndex([args.out_profile, ckpt_path])
+        ckpt = ProfileCheckpoint(ckpt_path, resume=args.resume, every=args.checkpoint_every)
+        prof_out = ProfileWriter(args.out_profile)
+    n_reused = 0
+
     # 결과 생성
     rows = []
-    freq_rows = []
-    global_cnt = Counter()
+    if args.shard:
+        # 샤드의 빈도는 항상 run 파일로 남겨 merge 가 k-way 병합
+        spill_dir = os.path.join(args.shard_dir, SHARD_FREQ_RUNS)
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        os.makedirs(spill_dir)
+    elif args.memory_budget:
+        spill_dir = tempfile.mkdtemp(prefix=".freq_spill_", dir=os.path.dirname(os.path.abspath(args.out_freq)))
+    else:
+        spill_dir = None
+    freq_store = TokenFreqStore(
+        memory_budget=args.memory_budget, spill_dir=spill_dir,
+        sketch=SpaceSavingCounter(args.global_sketch_capacity) if args.global_topk_mode == "spacesaving" else None,
+    )
     price_items = []
+    fact_rows = []
+    shard_records = []
+    search_db = SearchDbWriter(args.out_search_db) if args.out_search_db else None
+    # (추가) 월별 추이: 재채점이 아니면 카페를 처리하면서 새 (월, 카페) 빈도를 바로 기록
+    trend = TrendWriter(args.trend_dir) if args.trend_dir and not args.rescore else None
 
     for _, r in cafes.iterrows():
         name = safe_str(r["name"])
@@ -861,20 +3019,49 @@ def main(args):
                 if not map_link:
                     map_link = str(km.get("url","")).strip()
 
+        # Kiwi/정규식 작업(재채점 모드면 저장된 프로필 재사용)
+        posts = r["posts"] if isinstance(r["posts"], list) else []
+        segments = None
+        post_counts = None
+        weak = r["post_weak"] if isinstance(r["post_weak"], list) else None
+        if args.rescore:
+            prof = profiles.get(r["text_hash"])
+        else:
+            h = r["text_hash"]
+            prof = cached.get(h) if h in cached and cached.fp(h) == tok_fp else None
+            if prof is not None:
+                n_reused += 1
+            else:
+                segments = [] if search_db else None
+                post_counts = [] if trend else None
+                prof = build_cafe_profile(r["cafe_id"], name, district, addr, posts, r["text_hash"], tok_fp,
+                                          segments, weak, post_counts)
+                ckpt.add(prof)
+        n_profiles += 1
+        if prof_out is not None:
+            prof_out.add(prof)
+        if args.trend_dir:
+            cafe_meta.append((prof["cafe_id"], name, prof["row_sw"]))
+        if trend and posts:
+            add_cafe_trends(trend, r["cafe_id"], posts, r["post_dates"], post_counts, weak)
+
+        # (추가) 검색 DB: 방금 토큰화한 글은 그 형태소를, 재사용한 프로필이면 다시 나눔
+        if search_db and posts:
+            if segments is None:
+                segments = [fts_segment_text(t) for t in posts]
+            search_db.add_posts(r["cafe_id"], zip(r["post_links"], r["post_dates"], posts, segments))
+
         # 토큰/빈도 (카페명은 불용어로 추가)
-        extra_sw = build_row_stopwords(name, district, addr)
+        extra_sw = finalize_row_stopwords(prof["row_sw"])
+        base_cnt = Counter(prof["base_counts"])
         # (1) 태깅/메뉴 추출용 토큰(과도한 제거 금지)
-        toks_tag = kiwi_tokens(text, extra_stopwords=extra_sw, nouns_only=False, profile="tagging")
-        cnt_tag = Counter(toks_tag)
+        cnt_tag = derive_profile_counts(base_cnt, extra_sw, profile="tagging")
 
         # (2) TOP40/전역빈도용 토큰(노이즈 추가 제거)
-        toks_top = kiwi_tokens(text, extra_stopwords=extra_sw, nouns_only=False, profile="top40")
-        cnt_top = Counter(toks_top)
+        cnt_top = derive_profile_counts(base_cnt, extra_sw, profile="top40")
         top_keywords = [k for k, _ in cnt_top.most_common(40)]
 
-        for token, c in cnt_top.items():
-            freq_rows.append((r["cafe_id"], name, token, int(c)))
-            global_cnt[token] += int(c)
+        freq_store.add_cafe(r["cafe_id"], name, cnt_top, ordinal=r["_seq"])
 
         # 자동 태깅
         atmos_sc = score_from_dict(cnt_tag, ATMOSPHERE_DICT)
@@ -885,15 +3072,28 @@ def main(args):
         taste_tags = [k for k,_ in taste_sc[:3]]
         comp_tags  = [k for k,_ in comp_sc[:3]]
 
-        menus = extract_menus(text, cnt_tag, topk=8)
+        # 문장 추출 엔진 결과(fact). 재채점에서 MENU_KEYWORDS 가 바뀌었으면 메뉴만 본문에서 다시 찾음
+        facts = prof["facts"]
+        if prof.get("menu_fp") == menu_fp:
+            menu_hits = {f["value"] for f in facts if f["kind"] == "menu"}
+        else:
+            facts = [f for f in facts if f["kind"] != "menu"]
+            menu_hits = set(menu_mentions(text))
+        menus = extract_menus(menu_hits, cnt_tag, topk=8)
         main_menus = menus[:3]
-        parking = detect_parking(text)
+        parking = prof["parking"]
 
         reason = build_reason(main_menus, atmos_tags, taste_tags, parking)
 
         # ✅ 가격 추출(별도 CSV로 저장 + DB에도 요약만 넣기)
-        prices = extract_prices(text, window=35)
+        prices = finalize_prices(prof["price_cands"])
+        n_price_items, n_fact_rows = len(price_items), len(fact_rows)
+        for f in facts:
+            fact_rows.append({"카페id": r["cafe_id"], "카페이름": name, "kind": f["kind"],
+                              "value": f["value"], "sentence": f["sentence"]})
         for p in prices:
+            fact_rows.append({"카페id": r["cafe_id"], "카페이름": name, "kind": "price",
+                              "value": f"{p['item']} {p['price']}원".strip(), "sentence": p["sentence"]})
             price_items.append({
                 "카페id": r["cafe_id"],
                 "카페이름": name,
@@ -946,12 +3146,65 @@ def main(args):
 
             "키워드TOP40": json.dumps(top_keywords, ensure_ascii=False),
         })
+        if args.shard:
+            shard_records.append({"seq": int(r["_seq"]), "row": rows[-1],
+                                  "price_items": price_items[n_price_items:], "facts": fact_rows[n_fact_rows:]})
+
+    if ckpt is not None:
+        ckpt.close()
+        if args.resume:
+            print(f"[INFO] 재개: 체크포인트 재사용 {n_reused}곳, 새로 처리 {n_profiles - n_reused}곳")
+    profiles.close()
+    cached.close()
+
+    # (추가) 월별 키워드 추이(증분): 새 (월, 카페) 파티션 반영 → 최근 키워드/메뉴 급상승
+    if args.trend_dir:
+        if trend:
+            n_new = trend.finish()
+            print(f"[INFO] 월별 추이: 새로 계산한 (월, 카페) {n_new}건")
+        recent_df = build_recent_keywords(args.trend_dir, cafe_meta)
+        menu_trend_df = build_menu_trend(args.trend_dir)
+
+    if args.shard:
+        # 샤드 부분 출력(카페별 레코드 + 빈도 run + 프로필 + 식별표) → merge 명령으로 합침
+        if not args.rescore:
+            prof_out.commit()
+            os.remove(ckpt_path)
+        write_shard_outputs(args.shard_dir, args.shard, shard_records, freq_store, identity_df, post_filter_df,
+                            cafes_fp, n_total)
+        print(f"[OK] shard saved: {args.shard_dir}")
+        return
+
+    to_csv_atomic(identity_df, args.out_identity, index=False, encoding="utf-8-sig")
+    to_csv_atomic(post_filter_df, args.out_post_filter, index=False, encoding="utf-8-sig")
+    if args.trend_dir:
+        to_csv_atomic(recent_df, args.out_recent_keywords, index=False, encoding="utf-8-sig")
+        to_csv_atomic(menu_trend_df, args.out_menu_trend, index=False, encoding="utf-8-sig")
+    if not args.rescore:
+        # 최종 프로필을 확정한 뒤에야 체크포인트를 지웁니다.
+        prof_out.commit()
+        os.remove(ckpt_path)
+    saved = write_outputs(args, rows, price_items, fact_rows, freq_store)
+    if search_db:
+        search_db.finish(rows)
+        print(f"[INFO] 검색 DB: 카페 {len(rows)}곳, 글 {search_db.n_posts}개 색인")
+        saved.append(args.out_search_db)
 
+    print("[OK] saved:")
+    for path in saved:
+        print(" -", path)
+    print(" -", args.out_identity)
+    print(" -", args.out_post_filter)
+    if args.trend_dir:
+        print(" -", args.out_recent_keywords)
+        print(" -", args.out_menu_trend)
+    if not args.rescore:
+        print(" -", args.out_profile)
+
+def write_outputs(args, rows, price_items, fact_rows, freq_store):
+    """카페 행/가격 항목/fact/토큰 빈도 → 최종 CSV(+ MySQL CSV, DB 증분). main 과 merge 공용"""
     db_df = pd.DataFrame(rows)
     db_df = normalize_for_db(db_df)
-    freq_df = pd.DataFrame(freq_rows, columns=["cafe_id","name","token","count"]) \
-                .sort_values(["name","count"], ascending=[True, False])
-    global_df = pd.DataFrame(global_cnt.most_common(300), columns=["token","count"])
 
     # 가격표
     price_items_df = pd.DataFrame(price_items)
@@ -968,45 +3221,177 @@ def main(args):
         summ = pd.DataFrame(columns=["카페id","카페이름","가격목록","가격종류수","최소가","최대가","대표가(중앙값)"])
 
     # ✅ (추가) MySQL 적재용 컬럼명으로 변환한 DF 생성
-    db_mysql = db_df.rename(columns=KOR_TO_SQL_COL)
-
-    # (권장) 숫자형으로 캐스팅 (MySQL에서 DECIMAL/INT로 넣을 때 유리)
-    db_mysql["lat"] = pd.to_numeric(db_mysql["lat"], errors="coerce")
-    db_mysql["lng"] = pd.to_numeric(db_mysql["lng"], errors="coerce")
-    db_mysql["blog_count"] = pd.to_numeric(db_mysql["blog_count"], errors="coerce")
-    db_mysql["reco_score"] = pd.to_numeric(db_mysql["reco_score"], errors="coerce")
-
-    db_mysql = df_mysql_ready(db_mysql)
+    db_mysql = df_mysql_ready(sql_master_frame(db_df))
     out_master_mysql = args.out_master.replace(".csv", "_mysql.csv")
     export_mysql_csv(db_mysql, out_master_mysql)
 
-    db_df.to_csv(args.out_master, index=False, encoding="utf-8-sig")
-    freq_df.to_csv(args.out_freq, index=False, encoding="utf-8-sig")
-    global_df.to_csv(args.out_global, index=False, encoding="utf-8-sig")
-    price_items_df.to_csv(args.out_price_items, index=False, encoding="utf-8-sig")
-    summ.to_csv(args.out_price_summary, index=False, encoding="utf-8-sig")
-
-    print("[OK] saved:")
-    print(" -", args.out_master)
-    print(" -", args.out_freq)
-    print(" -", args.out_global)
-    print(" -", args.out_price_items)
-    print(" -", args.out_price_summary)
-    print(" -", out_master_mysql)
-
-def parse_args():
-    p = argparse.ArgumentParser()
-    p.add_argument("--place_csv", default=DEFAULT_PLACE_CSV)
-    p.add_argument("--blog_csv",  default=DEFAULT_BLOG_CSV)
-    p.add_argument("--kakao_csv", default=DEFAULT_KAKAO_CSV)
-
+    to_csv_atomic(db_df, args.out_master, index=False, encoding="utf-8-sig")
+    freq_store.write_freq_csv(args.out_freq)
+    freq_store.write_global_csv(args.out_global, 300)
+    freq_store.cleanup()
+    to_csv_atomic(price_items_df, args.out_price_items, index=False, encoding="utf-8-sig")
+    to_csv_atomic(summ, args.out_price_summary, index=False, encoding="utf-8-sig")
+    to_csv_atomic(pd.DataFrame(fact_rows, columns=["카페id", "카페이름", "kind", "value", "sentence"]),
+                  args.out_facts, index=False, encoding="utf-8-sig")
+
+    # (추가) DB 증분: 이전 스냅샷과 비교해 바뀐 카페만 delta.sql 로
+    if args.delta_dir:
+        def master_rows():
+            for vals in db_mysql.itertuples(index=False, name=None):
+                yield vals[0], list(vals)
+
+        def freq_rows():
+            with open(args.out_freq, encoding="utf-8-sig", newline="") as f:
+                rd = csv.reader(f)
+                next(rd, None)
+                for rec in rd:
+                    yield rec[0], rec
+
+        price_cols = list(PRICE_ITEM_SQL_COL)
+        def price_rows():
+            if price_items_df.empty:
+                return
+            for vals in price_items_df[price_cols].itertuples(index=False, name=None):
+                yield vals[0], list(vals)
+
+        delta_stats = build_db_delta(args.delta_dir, [
+            (args.sql_table_master, list(db_mysql.columns), master_rows, "upsert"),
+            (args.sql_table_freq, ["cafe_id", "cafe_name", "token", "count"], freq_rows, "replace"),
+            (args.sql_table_price, list(PRICE_ITEM_SQL_COL.values()), price_rows, "replace"),
+        ])
+        for table, (n_ins, n_upd, n_del, n_rows, n_full) in delta_stats.items():
+            pct = 100.0 * n_rows / n_full if n_full else 0.0
+            print(f"[INFO] 증분 {table}: insert {n_ins}, update {n_upd}, delete {n_del} 카페 "
+                  f"→ {n_rows}행 기록 (전체 적재 {n_full}행 대비 {pct:.1f}%)")
+        if args.delta_apply:
+            n = apply_db_delta(args.delta_dir, args.delta_apply, args.db_env)
+            print(f"[INFO] 증분 적용({args.delta_apply}): {n}건 → 스냅샷 갱신")
+        else:
+            print(f"[INFO] 증분 미적용: {os.path.join(args.delta_dir, DELTA_SQL)} "
+                  f"(적용 후 apply-delta --delta_dir {args.delta_dir} --mark_applied, 또는 --sink 로 적용)")
+
+    saved = [args.out_master, args.out_freq, args.out_global, args.out_price_items,
+             args.out_price_summary, args.out_facts, out_master_mysql]
+    if args.delta_dir:
+        saved.append(os.path.join(args.delta_dir, DELTA_APPLIED_SQL if args.delta_apply else DELTA_SQL))
+
+    # (추가) 정적 서빙용 카페/지역 JSON 문서(바뀐 문서만 다시 씀)
+    if args.out_docs_dir:
+        n_docs, n_written, n_removed = build_cafe_documents(
+            args.out_docs_dir, db_df, price_items_df, summ, fact_rows, args.out_freq, args.docs_workers)
+        print(f"[INFO] 문서 {n_docs}개 중 {n_written}개 새로 씀, {n_removed}개 삭제 "
+              f"(압축: {'+'.join(_doc_variants())}{'' if brotli else ', brotli 미설치로 .br 생략'})")
+        saved.append(os.path.join(args.out_docs_dir, DOCS_MANIFEST))
+    return saved
+
+def add_output_args(p):
     p.add_argument("--out_master", default=DEFAULT_OUT_MASTER)
     p.add_argument("--out_freq",   default=DEFAULT_OUT_FREQ)
     p.add_argument("--out_global", default=DEFAULT_OUT_GLOBAL)
     p.add_argument("--out_price_items", default=DEFAULT_OUT_PRICE_ITEMS)
     p.add_argument("--out_price_summary", default=DEFAULT_OUT_PRICE_SUMMARY)
-    return p.parse_args()
+    p.add_argument("--out_identity", default=DEFAULT_OUT_IDENTITY,
+                   help="원본 행(place/kakao) -> 정규 cafe_id 매핑표")
+    p.add_argument("--out_facts", default=DEFAULT_OUT_FACTS,
+                   help="문장 단위 추출 결과(주차/가격/메뉴/편의시설 + 출처 문장)")
+    p.add_argument("--out_post_filter", default=DEFAULT_OUT_POST_FILTER,
+                   help="카페별 블로그 글 거르기 건수(광고/목록형/스치듯 언급)")
+    p.add_argument("--out_profile", default=DEFAULT_OUT_PROFILE,
+                   help="카페별 Kiwi 결과(재채점용). 일반 실행 시 저장, --rescore 시 읽기")
+    p.add_argument("--delta_dir", default=None,
+                   help="DB 증분 폴더: 마지막으로 적용된 스냅샷(snapshot.json)과 비교해 바뀐 카페만 delta.sql 로 기록"
+                        "(+ schema.sql). 스냅샷은 적용 성공 후에만 전진")
+    p.add_argument("--delta_apply", default=None,
+                   help="빌드 직후 증분 적용: mysql(pymysql) | sqlite:경로. 생략 시 apply-delta 로 나중에 적용")
+    p.add_argument("--db_env", default=None,
+                   help="--delta_apply mysql 접속 정보 .env(DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME, 기본: 환경변수)")
+    p.add_argument("--sql_table_master", default=SQL_TABLE_MASTER, help="증분 적재 대상 마스터 테이블명")
+    p.add_argument("--sql_table_freq", default=SQL_TABLE_FREQ, help="증분 적재 대상 토큰빈도 테이블명")
+    p.add_argument("--sql_table_price", default=SQL_TABLE_PRICE, help="증분 적재 대상 가격항목 테이블명")
+    p.add_argument("--out_docs_dir", default=None,
+                   help="정적 서빙용 카페/지역 JSON 문서 폴더(.gz/.br 미리 압축 + manifest.json ETag). 바뀐 문서만 다시 씀")
+    p.add_argument("--docs_workers", type=int, default=None,
+                   help="문서 직렬화/압축 스레드 수(기본: CPU 수, 최대 8)")
+
+def parse_args():
+    p = argparse.ArgumentParser(epilog="샤드 병합: %(prog)s merge --shard_dirs DIR [DIR ...] [출력 옵션] | "
+                                       "분석기 벤치마크: %(prog)s bench --blog_csv CSV [CSV ...] | "
+                                       "증분 적용: %(prog)s apply-delta --delta_dir DIR --sink SINK")
+    # (추가) 여러 지역 CSV를 한 번에 넣으면 지역 간 중복 카페를 하나로 합칩니다.
+    p.add_argument("--place_csv", nargs="+", default=[DEFAULT_PLACE_CSV])
+    p.add_argument("--blog_csv",  nargs="+", default=[DEFAULT_BLOG_CSV])
+    p.add_argument("--kakao_csv", nargs="+", default=[DEFAULT_KAKAO_CSV])
+
+    add_output_args(p)
+    p.add_argument("--trend_dir", default=None,
+                   help="월별 토큰 빈도 파티션 폴더(지정 시 최근 키워드/메뉴 급상승 CSV 생성)")
+    p.add_argument("--out_recent_keywords", default=DEFAULT_OUT_RECENT_KEYWORDS)
+    p.add_argument("--out_menu_trend", default=DEFAULT_OUT_MENU_TREND)
+    p.add_argument("--resume", action="store_true",
+                   help="중단된 실행 재개: 체크포인트(<out_profile>.ckpt)와 기존 프로필에 있는 카페는 건너뜀")
+    p.add_argument("--checkpoint_every", type=int, default=20,
+                   help="체크포인트 fsync 주기(카페 수)")
+    p.add_argument("--memory_budget", type=parse_size, default=None,
+                   help="토큰 빈도 집계 메모리 상한(예: 512MB). 넘으면 정렬된 run을 디스크에 내보내고 마지막에 병합")
+    p.add_argument("--global_topk_mode", choices=["exact", "spacesaving"], default="exact",
+                   help="전역 빈도 집계: exact(정확, 기본) | spacesaving(고정 메모리 근사 + 오차 표시)")
+    p.add_argument("--global_sketch_capacity", type=int, default=3000,
+                   help="spacesaving 모드에서 감시할 토큰 수(클수록 정확, 상위 300개의 수 배 권장)")
+    p.add_argument("--post_filter", choices=["on", "off"], default="on",
+                   help="Kiwi 전 블로그 글 거르기(광고 가중치↓, 목록형/스치듯 언급 제외). off 면 모든 글 사용")
+    p.add_argument("--out_search_db", default=None,
+                   help="검색용 SQLite(마스터 + 블로그 본문 FTS5 형태소 색인) 경로. 지정 시에만 생성")
+    p.add_argument("--shard", type=parse_shard, default=None,
+                   help="i/N: cafe_id 해시로 나눈 N개 중 i번째만 처리해서 --shard_dir 에 부분 출력(merge 로 합침)")
+    p.add_argument("--shard_dir", default=None)
+    p.add_argument("--rescore", action="store_true",
+                   help="Kiwi 없이 저장된 프로필로 태깅/TOP40/추천만 다시 계산(입력/규칙이 바뀌었으면 중단)")
+    p.add_argument("--kiwi_mode", choices=list(KIWI_MODES), default="default",
+                   help="분석기 프리셋: fast(야간) | default | accurate(주간). 아래 개별 옵션이 프리셋을 덮어씀")
+    p.add_argument("--kiwi_model", choices=["cong", "cong-global"], default=None)
+    p.add_argument("--kiwi_typos", choices=KIWI_TYPOS, default=None, help="오타 교정(none 이면 끔)")
+    p.add_argument("--kiwi_match", default=None,
+                   help="Kiwi 매칭 옵션: ALL | NONE | URL+EMAIL+HASHTAG 처럼 + 로 연결")
+    p.add_argument("--kiwi_threads", type=int, default=None,
+                   help="Kiwi 스레드 수(-1 이면 모든 코어). 카페마다 글 단위로 병렬 분석")
+    args = p.parse_args()
+    if args.kiwi_match is not None:
+        try:
+            parse_match_options(args.kiwi_match)
+        except argparse.ArgumentTypeError as e:
+            p.error(str(e))
+    if args.delta_apply and not args.delta_dir:
+        p.error("--delta_apply 에는 --delta_dir 가 필요합니다")
+    if args.shard:
+        if not args.shard_dir:
+            p.error("--shard 에는 --shard_dir 가 필요합니다")
+        if args.trend_dir or args.delta_dir or args.out_search_db or args.out_docs_dir:
+            p.error("--shard 에서는 --trend_dir/--delta_dir/--out_search_db/--out_docs_dir 를 쓸 수 없습니다"
+                    "(merge 에서 --delta_dir/--out_docs_dir 지정)")
+        os.makedirs(args.shard_dir, exist_ok=True)
+        # 샤드마다 프로필/체크포인트가 섞이지 않도록 샤드 폴더에 둠
+        args.out_profile = os.path.join(args.shard_dir, SHARD_PROFILE)
+    return args
+
+def parse_merge_args(argv):
+    p = argparse.ArgumentParser(prog="build_cafe_db_enriched_v5.py merge",
+                                description="--shard 로 만든 부분 출력들을 한 번에 돌린 결과와 같은 최종 출력으로 병합")
+    p.add_argument("--shard_dirs", nargs="+", required=True)
+    add_output_args(p)
+    args = p.parse_args(argv)
+    if args.delta_apply and not args.delta_dir:
+        p.error("--delta_apply 에는 --delta_dir 가 필요합니다")
+    return args
 
 if __name__ == "__main__":
-    args = parse_args()
-    main(args)
+    if sys.argv[1:2] == ["merge"]:
+        merge_shards(parse_merge_args(sys.argv[2:]))
+    elif sys.argv[1:2] == ["search"]:
+        run_search(sys.argv[2:])
+    elif sys.argv[1:2] == ["bench"]:
+        run_bench(sys.argv[2:])
+    elif sys.argv[1:2] == ["apply-delta"]:
+        run_apply_delta(sys.argv[2:])
+    else:
+        args = parse_args()
+        main(args)
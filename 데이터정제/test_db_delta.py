@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+DB 증분(--delta_dir) 상태 전이 확인: 빌드 → (적용 없이 다시 빌드) → sqlite 로컬 미러에 적용 → 바꾸고 다시
+
+- 적용 전에는 스냅샷이 전진하지 않고, 다시 빌드해도 증분이 누적(앞선 변경이 사라지지 않음)
+- 적용이 성공한 뒤에만 snapshot.pending.json → snapshot.json, 그 다음 빌드는 0행 증분
+- 카페 1곳 글 변경(마스터 upsert, 자식 테이블 지우고 다시 넣기) + 1곳 삭제 후 미러가 CSV 와 같은지
+- 적용이 실패하면(트랜잭션 롤백) 스냅샷/대기 증분이 그대로인지
+- 실행: python -m pytest -q 데이터정제/test_db_delta.py
+"""
+import os, re, csv, shutil, sqlite3, tempfile
+from collections import Counter
+import pandas as pd
+import pytest
+
+import build_cafe_db_enriched_v5 as v5
+from test_shard_merge import make_fixture, output_args, run
+
+def build(work, inputs, out_dir, delta_dir, *extra):
+    """빌드 후 테이블별 증분 행 수 {테이블: 행}"""
+    out = run(inputs + output_args(out_dir) + ["--delta_dir", delta_dir] + list(extra), work)
+    return {t: int(n) for t, n in re.findall(r"증분 (\w+): .*?→ (\d+)행 기록", out)}
+
+def read_csv_rows(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rd = csv.reader(f)
+        next(rd, None)
+        return [[None if v in ("", v5.MYSQL_NULL) else v for v in rec] for rec in rd]
+
+def mirror_rows(db, table):
+    con = sqlite3.connect(db)
+    try:
+        return con.execute(f'SELECT * FROM "{table}"').fetchall()
+    finally:
+        con.close()
+
+def assert_mirror_matches(db, out_dir):
+    master = read_csv_rows(os.path.join(out_dir, "master_mysql.csv"))
+    got = mirror_rows(db, v5.SQL_TABLE_MASTER)
+    assert sorted(r[0] for r in got) == sorted(r[0] for r in master)
+    freq = read_csv_rows(os.path.join(out_dir, "freq.csv"))
+    assert Counter(mirror_rows(db, v5.SQL_TABLE_FREQ)) == Counter(tuple(r) for r in freq)
+    prices = pd.read_csv(os.path.join(out_dir, "price_items.csv"), encoding="utf-8-sig")
+    assert Counter(r[0] for r in mirror_rows(db, v5.SQL_TABLE_PRICE)) == Counter(prices["카페id"].astype(str))
+
+def check_db_delta(work):
+    place, blog, kakao = make_fixture(work)
+    inputs = ["--place_csv", place, "--blog_csv", blog, "--kakao_csv", kakao]
+    out_dir, delta = os.path.join(work, "out"), os.path.join(work, "delta")
+    mirror = os.path.join(work, "mirror.sqlite")
+    snap, pending = os.path.join(delta, v5.DELTA_SNAPSHOT), os.path.join(delta, v5.DELTA_PENDING)
+
+    # 1) 첫 빌드: 전체가 증분, 스냅샷은 아직 없음(대기만)
+    first = build(work, inputs, out_dir, delta)
+    assert all(n > 0 for n in first.values()) and len(first) == 3
+    assert os.path.exists(pending) and not os.path.exists(snap)
+    assert os.path.exists(os.path.join(delta, v5.DELTA_SCHEMA))
+
+    # 2) 적용 없이 다시 빌드: 증분이 그대로(누적) 남아 있어야 함
+    assert build(work, inputs, out_dir, delta) == first
+    assert not os.path.exists(snap)
+
+    # 3) 적용(CLI) → 스냅샷 전진, 대기 파일 정리, 미러 = CSV
+    run(["apply-delta", "--delta_dir", delta, "--sink", f"sqlite:{mirror}"], work)
+    assert os.path.exists(snap) and not os.path.exists(pending)
+    assert os.path.exists(os.path.join(delta, v5.DELTA_APPLIED_SQL))
+    assert not os.path.exists(os.path.join(delta, v5.DELTA_OPS))
+    assert_mirror_matches(mirror, out_dir)
+
+    # 4) 바뀐 것 없이 다시 빌드 → 0행 증분
+    assert set(build(work, inputs, out_dir, delta).values()) == {0}
+    run(["apply-delta", "--delta_dir", delta, "--sink", f"sqlite:{mirror}"], work)
+
+    # 5) 카페 1곳 글 변경 + 1곳 삭제 → 빌드와 함께 적용(--delta_apply)
+    freq = pd.read_csv(os.path.join(out_dir, "freq.csv"), encoding="utf-8-sig")
+    prices = pd.read_csv(os.path.join(out_dir, "price_items.csv"), encoding="utf-8-sig")
+    names = list(dict.fromkeys(freq["name"]))
+    removed = next(n for n in names if n in set(prices["카페이름"]))   # 세 테이블 모두에 행이 있는 카페
+    changed = next(n for n in names if n != removed)
+    removed_id = freq.loc[freq["name"] == removed, "cafe_id"].iloc[0]
+    changed_id = freq.loc[freq["name"] == changed, "cafe_id"].iloc[0]
+    old_changed_tokens = set(freq.loc[freq["cafe_id"] == changed_id, "token"])
+
+    place_df = pd.read_csv(place)
+    place_df[place_df["name"] != removed].to_csv(place, index=False, encoding="utf-8-sig")
+    blog_df = pd.read_csv(blog)
+    blog_df.loc[blog_df["name"] == changed, "content"] = "딸기빙수 팥빙수 망고빙수 빙수 맛집 " + changed
+    blog_df.to_csv(blog, index=False, encoding="utf-8-sig")
+
+    n_master_before = len(mirror_rows(mirror, v5.SQL_TABLE_MASTER))
+    stats = build(work, inputs, out_dir, delta, "--delta_apply", f"sqlite:{mirror}")
+    assert 0 < stats[v5.SQL_TABLE_MASTER] < first[v5.SQL_TABLE_MASTER]
+    assert not os.path.exists(pending)
+    assert_mirror_matches(mirror, out_dir)
+    assert len(mirror_rows(mirror, v5.SQL_TABLE_MASTER)) == n_master_before - 1
+    for table in (v5.SQL_TABLE_MASTER, v5.SQL_TABLE_FREQ, v5.SQL_TABLE_PRICE):
+        assert removed_id not in {r[0] for r in mirror_rows(mirror, table)}, table
+    # replace 테이블: 바뀐 카페의 예전 토큰 행이 남지 않음
+    new_tokens = {r[2] for r in mirror_rows(mirror, v5.SQL_TABLE_FREQ) if r[0] == changed_id}
+    assert new_tokens != old_changed_tokens and "빙수" in new_tokens
+
+    # 6) 적용 실패(미러 테이블 구조가 다름) → 롤백, 스냅샷/대기 증분 그대로
+    blog_df.loc[blog_df["name"] == changed, "content"] = "크로플 크로플 아이스크림 " + changed
+    blog_df.to_csv(blog, index=False, encoding="utf-8-sig")
+    assert build(work, inputs, out_dir, delta)[v5.SQL_TABLE_FREQ] > 0
+    with open(snap, "rb") as f:
+        snap_before = f.read()
+    bad = os.path.join(work, "bad.sqlite")
+    con = sqlite3.connect(bad)
+    con.execute(f'CREATE TABLE "{v5.SQL_TABLE_MASTER}" (cafe_id PRIMARY KEY)')
+    con.commit()
+    con.close()
+    with pytest.raises(sqlite3.OperationalError):
+        v5.apply_db_delta(delta, f"sqlite:{bad}")
+    with open(snap, "rb") as f:
+        assert f.read() == snap_before
+    assert os.path.exists(pending) and os.path.exists(os.path.join(delta, v5.DELTA_OPS))
+    assert mirror_rows(bad, v5.SQL_TABLE_MASTER) == []
+
+def test_db_delta_apply_cycle(tmp_path):
+    check_db_delta(str(tmp_path))
+
+if __name__ == "__main__":
+    work = tempfile.mkdtemp(prefix="db_delta_")
+    try:
+        check_db_delta(work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    print("[OK] 증분 빌드/적용/스냅샷 전이가 맞습니다")
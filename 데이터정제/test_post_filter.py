@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Kiwi 전 블로그 글 거르기(classify_post) 확인 - 실제 데이터의 상호 모양으로
+
+- 여러 낱말 상호를 블로거가 줄여 쓴 글('세컨드원 가든 광주수완점' → '세컨드원 광주수완점')이 남는지
+- 업종/지역 낱말만 맞는 글은 스치듯 언급으로 빠지는지, 같은 카페 묶음의 다른 상호 표기로도 맞는지
+- 카페의 글이 모두 제외 판정이면 하나는 남는지
+- 실행: python -m pytest -q 데이터정제/test_post_filter.py
+"""
+import build_cafe_db_enriched_v5 as v5
+
+FILLER = " 오늘은 날씨가 좋아서 산책을 오래 했어요." * 80   # 긴 글(POST_PASSING_MIN_LEN 이상) 만들기용
+
+def verdict(text, *names):
+    return v5.classify_post(v5.clean_text(text), v5.post_name_keys(names))
+
+def test_name_keys_skip_branch_and_generic_words():
+    keys = v5.post_name_keys(["세컨드원 가든 광주수완점"])
+    assert "세컨드원" in keys and "세컨드원가든" in keys
+    assert not any("수완" in k for k in keys)            # 지점 표기는 다른 지점 글에도 나옴
+    assert v5.post_name_keys(["담양 리사 카페"]) >= {"리사"}
+    assert not {"담양", "카페"} & v5.post_name_keys(["담양 리사 카페"])
+    assert "브런치카페" not in v5.post_name_keys(["아필코 브런치카페 광주봉선점"])
+
+def test_shortened_multiword_names_are_kept():
+    cases = [
+        ("세컨드원 가든 광주수완점", "광주 수완지구 빵집에 다녀왔어요. 세컨드원 광주수완점 몰랑이 인테리어가 귀여워요."),
+        ("리원베이커리&카페", "전남 담양 카페 '리원베이커리'에 다녀왔어요. 논밭뷰 2층 단독 건물이에요."),
+        ("아필코 브런치카페 광주봉선점", "봉선동 브런치카페 아필코 APLICO 09:00-22:00 이마트 주차하고 내려가면 아필코 나와요."),
+        ("담양 리사 카페", "담양 대형 카페 '리사' 광주에서 약 40분 거리에 있는 리사 카페에 방문했습니다!"),
+    ]
+    for name, text in cases:
+        assert verdict(text, name) == "", name
+
+def test_generic_words_alone_are_passing():
+    assert verdict("담양 카페 투어 다녀왔어요. 광주 근교 카페 중에 뷰가 좋은 곳이에요.", "담양 리사 카페") == "passing"
+
+def test_identity_group_variants_match():
+    # 블로그 검색명에 없는 표기라도 같은 카페 묶음(카카오 상호 등)의 표기로 맞으면 남김
+    text = "봉선동 APLICO 브런치 다녀왔어요."
+    assert verdict(text, "아필코 광주봉선점") == "passing"
+    assert verdict(text, "아필코 광주봉선점", "APLICO 봉선점") == ""
+
+def test_single_mention_in_long_post_with_no_topic_is_passing():
+    text = "세컨드원 광주수완점 근처에서 친구를 만났어요." + FILLER
+    assert verdict(text, "세컨드원 가든 광주수완점") == "passing"
+    assert verdict(text + " 세컨드원 빵이 맛있어요", "세컨드원 가든 광주수완점") == ""
+    assert verdict(text + " 소금빵 3,500원", "세컨드원 가든 광주수완점") == ""
+
+def test_verdict_does_not_depend_on_menu_lexicon(monkeypatch):
+    # 판정은 남는 글 → text_hash 를 정하므로, 메뉴 사전을 고쳐도 바뀌면 안 됨(--rescore 로 사전 반복)
+    text = "세컨드원 광주수완점 근처에서 친구를 만났어요. 소금빵 크루아상 케이크 마카롱 빙수" + FILLER
+    before = verdict(text, "세컨드원 가든 광주수완점")
+    monkeypatch.setattr(v5, "menu_mentions", lambda t: (_ for _ in ()).throw(AssertionError("메뉴 사전 사용")))
+    assert verdict(text, "세컨드원 가든 광주수완점") == before == "passing"
+
+def test_listing_and_sponsored():
+    listing = "세컨드원 " + " ".join(["50m © NAVER Corp. 가게"] * v5.POST_LISTING_MIN_CARDS)
+    assert verdict(listing, "세컨드원 가든 광주수완점") == "listing"
+    assert verdict("본 포스팅은 소정의 원고료를 받아 작성한 세컨드원 후기입니다", "세컨드원 가든 광주수완점") == "sponsored"
+
+def test_keep_last_post():
+    keys = v5.post_name_keys(["담양 리사 카페"])
+    texts = ["담양 카페 다녀옴", "리사 리사 협찬 받은 글" + FILLER, "리사 한 번" + FILLER, "다른 카페 글"]
+    cids = ["a", "a", "a", "b"]
+    verdicts = ["passing", "passing", "passing", ""]
+    out = v5.keep_last_post(cids, texts, verdicts, [keys] * 4)
+    # 상호가 가장 많이 나온 글 하나만 되살리고, 광고 여부는 다시 판정
+    assert out == ["passing", "sponsored", "passing", ""]
+    # 남은 글이 있는 카페는 그대로
+    assert v5.keep_last_post(["a", "a"], ["x", "리사"], ["passing", ""], [keys] * 2) == ["passing", ""]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+샤드 실행(--shard i/N) + merge 결과가 한 번에 돌린 결과와 바이트 단위로 같은지 확인합니다.
+
+- 북구 데이터 앞쪽 카페 일부로 작은 입력을 만들고, 스크립트를 서브프로세스로 실행합니다.
+- 비교 대상: 한 번에 실행(기준) / 한 번에 + --memory_budget(spill) /
+  2개 샤드 merge / 3개 샤드 + --memory_budget 후 merge (merge 의 --shard_dirs 는 섞은 순서)
+- 실행: python -m pytest -q 데이터정제/test_shard_merge.py  또는  python 데이터정제/test_shard_merge.py
+"""
+import os, sys, random, shutil, filecmp, tempfile, subprocess
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, "build_cafe_db_enriched_v5.py")
+DATA_DIR = os.path.join(HERE, "..", "데이터", "북구")
+PLACE_CSV = os.path.join(DATA_DIR, "gwangju_dessert_cafes_naver_place_bukgu.csv")
+BLOG_CSV  = os.path.join(DATA_DIR, "gwangju_dessert_cafes_blog_links_bukgu.csv")
+KAKAO_CSV = os.path.join(DATA_DIR, "gwangju_dessert_cafes_kakao_bukgu.csv")
+
+N_CAFES = 24               # 입력 카페 수(작게: Kiwi 분석 시간)
+MEMORY_BUDGET = "8KB"      # 카페 몇 곳마다 spill 되도록 아주 작게
+
+# 출력 옵션 → 파일명(마스터의 _mysql 판은 out_master 이름에서 파생)
+OUTPUTS = {
+    "--out_master": "master.csv",
+    "--out_freq": "freq.csv",
+    "--out_global": "global.csv",
+    "--out_price_items": "price_items.csv",
+    "--out_price_summary": "price_summary.csv",
+    "--out_identity": "identity.csv",
+    "--out_facts": "facts.csv",
+    "--out_post_filter": "post_filter.csv",
+    "--out_profile": "profile.jsonl",
+}
+COMPARED = list(OUTPUTS.values()) + ["master_mysql.csv"]
+
+def make_fixture(d):
+    """북구 입력에서 앞쪽 N_CAFES 곳(+ 그 카페들의 블로그 글)만 잘라 저장. 여러 줄 HTML 필드 때문에 pandas 로 자름"""
+    place = pd.read_csv(PLACE_CSV).iloc[:N_CAFES]
+    blog = pd.read_csv(BLOG_CSV)
+    blog = blog[blog["name"].isin(set(place["name"]))]
+    paths = [os.path.join(d, n) for n in ("place.csv", "blog.csv", "kakao.csv")]
+    place.to_csv(paths[0], index=False, encoding="utf-8-sig")
+    blog.to_csv(paths[1], index=False, encoding="utf-8-sig")
+    shutil.copyfile(KAKAO_CSV, paths[2])
+    return paths
+
+def output_args(out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    args = []
+    for opt, name in OUTPUTS.items():
+        args += [opt, os.path.join(out_dir, name)]
+    return args
+
+def run(args, cwd):
+    # 기본 출력 경로(최근 키워드 등)가 저장소를 더럽히지 않도록 임시 폴더에서 실행
+    proc = subprocess.run([sys.executable, SCRIPT] + args, cwd=cwd, capture_output=True, text=True,
+                          encoding="utf-8", errors="replace")
+    assert proc.returncode == 0, f"실행 실패: {' '.join(args)}\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}"
+    return proc.stdout
+
+def assert_same_outputs(ref_dir, out_dir, label):
+    diff = [n for n in COMPARED if not filecmp.cmp(os.path.join(ref_dir, n), os.path.join(out_dir, n), shallow=False)]
+    assert not diff, f"{label}: 기준 실행과 다른 파일 {diff}"
+
+def run_sharded(work, inputs, n, extra, seed):
+    shard_dirs = []
+    for i in range(n):
+        d = os.path.join(work, f"shard{n}_{i}")
+        run(inputs + ["--shard", f"{i}/{n}", "--shard_dir", d] + extra, work)
+        shard_dirs.append(d)
+    random.Random(seed).shuffle(shard_dirs)
+    out_dir = os.path.join(work, f"merged{n}")
+    run(["merge", "--shard_dirs"] + shard_dirs + output_args(out_dir), work)
+    return out_dir, shard_dirs
+
+def n_freq_runs(shard_dir):
+    runs = os.path.join(shard_dir, "freq_runs")
+    return sum(1 for n in os.listdir(runs) if n.startswith("freq_")) if os.path.isdir(runs) else 0
+
+def check_shard_merge(work):
+    place, blog, kakao = make_fixture(work)
+    inputs = ["--place_csv", place, "--blog_csv", blog, "--kakao_csv", kakao]
+
+    ref_dir = os.path.join(work, "single")
+    run(inputs + output_args(ref_dir), work)
+
+    spill_dir = os.path.join(work, "single_spill")
+    run(inputs + output_args(spill_dir) + ["--memory_budget", MEMORY_BUDGET], work)
+    assert_same_outputs(ref_dir, spill_dir, "--memory_budget")
+
+    out_dir, _ = run_sharded(work, inputs, 2, [], seed=1)
+    assert_same_outputs(ref_dir, out_dir, "2개 샤드 merge")
+
+    out_dir, shard_dirs = run_sharded(work, inputs, 3, ["--memory_budget", MEMORY_BUDGET], seed=2)
+    # 샤드의 run 파일은 shard_dir 에 남으므로 spill 이 실제로 일어났는지(샤드당 run 2개 이상) 확인 가능
+    assert max(map(n_freq_runs, shard_dirs)) >= 2, "memory_budget 샤드에서 spill 이 일어나지 않았습니다"
+    assert_same_outputs(ref_dir, out_dir, "3개 샤드(+memory_budget) merge")
+
+def test_shard_merge_matches_single_run(tmp_path):
+    check_shard_merge(str(tmp_path))
+
+if __name__ == "__main__":
+    work = tempfile.mkdtemp(prefix="shard_merge_")
+    try:
+        check_shard_merge(work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    print("[OK] 샤드 merge 결과가 한 번에 실행한 결과와 같습니다")
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+SpaceSavingCounter(전역 빈도 근사)의 오차 보장을 무작위 스트림으로 확인합니다.
+
+- 감시 중인 토큰: count - error <= 참 빈도 <= count
+- top(k) 에서 guaranteed 인 토큰은 참 상위 k 안에 있음(자기보다 참 빈도가 큰 토큰이 k 개 미만)
+- 감시 밖 토큰의 참 빈도 <= _floor()
+- merge(): 샤드별 요약을 합쳐도(순서 무관) 위 보장이 유지됨 - 샤드 실행의 전역 빈도가 이 경로
+- 밀어낸 적이 없으면(어휘 <= capacity) 정확값과 같음
+- 실행: python -m pytest -q 데이터정제/test_space_saving.py
+"""
+import random
+from collections import Counter
+
+import build_cafe_db_enriched_v5 as v5
+
+N_TRIALS = 200
+TOPK = 10
+
+def random_stream(rng):
+    """(토큰, 빈도) 목록 - 긴 꼬리(지프 비슷한) 분포"""
+    vocab = rng.randint(20, 300)
+    weights = [1.0 / (i + 1) ** rng.uniform(0.6, 1.4) for i in range(vocab)]
+    toks = rng.choices([f"t{i}" for i in range(vocab)], weights, k=rng.randint(200, 3000))
+    return [(t, rng.randint(1, 5)) for t in toks]
+
+def feed(sk, stream, seq0=0):
+    for i, (t, c) in enumerate(stream):
+        sk.add(t, c, seq0 + i)
+    return sk
+
+def assert_bounds(sk, truth, k=TOPK):
+    for t, (count, error, _) in sk.items.items():
+        assert count - error <= truth[t] <= count, (t, count, error, truth[t])
+    floor = sk._floor()
+    for t, n in truth.items():
+        if t not in sk.items:
+            assert n <= floor, (t, n, floor)
+    for t, count, error, guaranteed in sk.top(k):
+        if guaranteed:
+            assert sum(1 for n in truth.values() if n > truth[t]) < k, (t, truth[t])
+    assert sk.total == sum(truth.values())
+    assert len(sk.items) <= sk.capacity and len(sk.heap) <= 8 * sk.capacity
+
+def test_single_stream_bounds():
+    rng = random.Random(36)
+    for _ in range(N_TRIALS):
+        stream = random_stream(rng)
+        sk = feed(v5.SpaceSavingCounter(rng.randint(5, 60)), stream)
+        truth = Counter()
+        for t, c in stream:
+            truth[t] += c
+        assert_bounds(sk, truth)
+
+def test_merged_shards_bounds():
+    rng = random.Random(37)
+    for _ in range(N_TRIALS):
+        stream = random_stream(rng)
+        cap = rng.randint(5, 60)
+        n = rng.randint(2, 5)
+        cuts = sorted(rng.sample(range(1, len(stream)), n - 1))
+        parts = [stream[a:b] for a, b in zip([0] + cuts, cuts + [len(stream)])]
+        shards = [feed(v5.SpaceSavingCounter(cap), p, seq0=i << 32) for i, p in enumerate(parts)]
+        # 샤드 요약은 JSON 으로 저장/읽기 후 병합(merge 서브커맨드와 같은 경로), 병합 순서는 섞음
+        shards = [v5.SpaceSavingCounter.from_json(sk.to_json()) for sk in shards]
+        rng.shuffle(shards)
+        merged = shards[0]
+        for sk in shards[1:]:
+            merged.merge(sk)
+        truth = Counter()
+        for t, c in stream:
+            truth[t] += c
+        assert_bounds(merged, truth)
+
+def test_exact_without_eviction():
+    rng = random.Random(38)
+    stream = random_stream(rng)
+    truth = Counter()
+    for t, c in stream:
+        truth[t] += c
+    sk = feed(v5.SpaceSavingCounter(len(truth)), stream)
+    assert not sk.evicted
+    assert {t: v[0] for t, v in sk.items.items()} == dict(truth)
+    assert all(g for *_, g in sk.top(TOPK))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+clean_text / norm(한 번의 정규식 패스) 가 예전 여러 단계 구현과 같은 결과인지 무작위 문자열로 확인합니다.
+
+- 예전 구현(이모지→공백, URL 제거, 개행 치환, 공백 압축 / 괄호 묶음 제거 후 특수문자 제거)을 그대로 옮겨 두고 비교
+- 문자 풀: 한글/영문 대소문자/숫자, 이모지 경계 문자, FE0F/ZWJ, URL 조각, 여러 유니코드 공백, 괄호
+- 실행: python -m pytest -q 데이터정제/test_text_clean.py
+"""
+import re
+import random
+import build_cafe_db_enriched_v5 as v5
+
+N_CASES = 100_000
+
+_OLD_EMOJI_RE = re.compile("[" + v5._EMOJI_RANGES + "]+", flags=re.UNICODE)
+
+def old_clean_text(text):
+    if not isinstance(text, str):
+        return ""
+    text = _OLD_EMOJI_RE.sub(" ", text)
+    text = text.replace("\uFE0F", " ").replace("\u200D", " ")
+    text = re.sub(r"https?://\S+|www\.\S+", " ", text)
+    text = re.sub(r"[\r\n\t]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+def old_norm(s):
+    if not isinstance(s, str):
+        return ""
+    s = s.lower()
+    s = re.sub(r"\([^)]*\)", "", s)
+    s = re.sub(r"[^0-9a-z가-힣]+", "", s)
+    return s
+
+# 경계값 위주 문자 풀(범위 양 끝 + 바로 바깥) + 자주 나오는 조각
+_ATOMS = (
+    list("가힣각ㄱaZz09 .,-_/:#@&+~!?") +
+    ["(", ")", "((", "))", "(지점)", "[", "]", "\r", "\n", "\t", "\r\n", "\u3000", "\xa0", " ", "\x0b", "\x1c",
+     "\uFE0F", "\u200D", "http://", "https://", "www.", "http", "ttps://", ".com", "?q=1",
+     "\U0001F600", "\U0001F64F", "\U0001F650", "\U0001F300", "\U0001F5FF", "\U0001F680", "\U0001F6FF",
+     "\U0001F1E0", "\U0001F1FF", "\U00002700", "\U000027BF", "\U000027C0", "\U0001F900", "\U0001F9FF",
+     "\U0001FA70", "\U0001FAFF", "\U00002600", "\U000026FF", "\U000025FF", "☕", "🍰",
+     "\u2764\uFE0F", "\U0001F468\u200D\U0001F469\u200D\U0001F467"]
+)
+
+def random_text(rng):
+    return "".join(rng.choice(_ATOMS) for _ in range(rng.randint(0, 24)))
+
+def test_clean_text_matches_old_implementation():
+    rng = random.Random(31)
+    for _ in range(N_CASES):
+        t = random_text(rng)
+        assert v5.clean_text(t) == old_clean_text(t), repr(t)
+    for v in (None, float("nan"), 3):
+        assert v5.clean_text(v) == old_clean_text(v) == ""
+
+def test_norm_matches_old_implementation():
+    rng = random.Random(32)
+    for _ in range(N_CASES):
+        t = random_text(rng)
+        assert v5.norm(t) == old_norm(t), repr(t)
+
+def test_norm_series_matches_norm():
+    import pandas as pd
+    rng = random.Random(33)
+    texts = [random_text(rng) for _ in range(2000)]
+    assert v5.norm_series(pd.Series(texts)).tolist() == [v5.norm(t) for t in texts]